@@ -0,0 +1,320 @@
+import asyncio
+import glob
+import gzip
+import json
+import os
+import re
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional
+
+LEGACY_RE = re.compile(r"\[(.*?)\] (?:Unauthorized access by ID (\d+), username: @(.*?), text: (.*)|(.*))$")
+INDEX_RECORD = struct.Struct("<qdq")  # line offset, timestamp, user id (0 for notes)
+
+
+def read_lines_reverse(f, end: Optional[int] = None, block_size: int = 8192) -> Iterator[bytes]:
+    """Yield lines of a binary file from the end towards the start without reading it whole"""
+    f.seek(0, os.SEEK_END)
+    position = f.tell() if end is None else end
+    remainder = b""
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        chunk = f.read(size) + remainder
+        lines = chunk.split(b"\n")
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line
+    if remainder:
+        yield remainder
+
+
+def parse_entry(raw: bytes) -> dict:
+    line = raw.decode(errors="replace").rstrip("\r\n")
+    if line.startswith("{"):
+        try:
+            return json.loads(line)
+        except ValueError:
+            pass
+    match = LEGACY_RE.match(line)
+    if not match:
+        return {"ts": 0.0, "event": "note", "text": line}
+    stamp, uid, username, text, note = match.groups()
+    try:
+        ts = datetime.fromisoformat(stamp).timestamp()
+    except ValueError:
+        ts = 0.0
+    if uid:
+        return {"ts": ts, "event": "unauthorized", "user_id": int(uid), "username": username, "text": text}
+    return {"ts": ts, "event": "note", "text": note}
+
+
+class AccessLog:
+    """JSON-lines access log with a buffered writer and a sidecar index.
+
+    `record()` only appends to an in-memory buffer and calls `on_record`
+    (with `True` once the buffer is full) so the owner can schedule a
+    `flush()`, which writes the whole buffer in one append. The `.idx` sidecar keeps the byte
+    offset, timestamp and user id of every line so filtered queries seek
+    straight to the matching lines instead of parsing the whole file.
+
+    When the file grows past `max_bytes` (or `rotate()` is called on a
+    schedule) it is gzip-compressed into a timestamped archive; at most
+    `keep_archives` are kept. Queries continue into the archives, skipping
+    those whose recorded time span or user set cannot match.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0, max_buffer: int = 200,
+                 max_bytes: int = 0, keep_archives: int = 14):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.manifest_path = path + ".archives.json"
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_bytes = max_bytes
+        self.keep_archives = keep_archives
+        self._buffer: List[dict] = []
+        self.on_record: Optional[Callable[[bool], None]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._offsets = array("q")
+        self._stamps = array("d")
+        self._users = array("q")
+        if not os.path.exists(path):
+            self._write_sync([{"ts": round(time.time(), 3), "event": "note", "text": "Log file created automatically."}])
+        self._load_index()
+
+    # ---- writing ----
+
+    def record(self, event: str, **fields):
+        self._buffer.append({"ts": round(time.time(), 3), "event": event, **fields})
+        if self.on_record is not None:
+            self.on_record(len(self._buffer) >= self.max_buffer)
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def flush(self):
+        async with self._get_lock():
+            if not self._buffer:
+                return
+            entries, self._buffer = self._buffer, []
+            records = await asyncio.to_thread(self._write_sync, entries)
+            self._append_index(records)
+            if self.max_bytes and records and records[-1][0] >= self.max_bytes:
+                await asyncio.to_thread(self._rotate_sync)
+
+    def _write_sync(self, entries: List[dict]) -> List[tuple]:
+        records = []
+        with open(self.path, "ab") as f:
+            data = bytearray()
+            offset = f.tell()
+            for entry in entries:
+                line = (json.dumps(entry, ensure_ascii=False) + "\n").encode()
+                records.append((offset + len(data), float(entry["ts"]), int(entry.get("user_id") or 0)))
+                data += line
+            f.write(data)
+        with open(self.index_path, "ab") as f:
+            f.write(b"".join(INDEX_RECORD.pack(*r) for r in records))
+        return records
+
+    def _append_index(self, records: List[tuple]):
+        for offset, ts, uid in records:
+            self._offsets.append(offset)
+            self._stamps.append(ts)
+            self._users.append(uid)
+
+    async def clear(self, note: str, archives: bool = False):
+        async with self._get_lock():
+            self._buffer = []
+            await asyncio.to_thread(self._reset_sync, note)
+            if archives:
+                for archive in self.archives():
+                    os.remove(archive)
+                self._save_manifest({})
+
+    # ---- rotation ----
+
+    async def rotate(self) -> Optional[str]:
+        """Flush, then compress the current file into an archive; returns the archive path"""
+        await self.flush()
+        async with self._get_lock():
+            return await asyncio.to_thread(self._rotate_sync)
+
+    def _rotate_sync(self) -> Optional[str]:
+        if len(self._offsets) <= 1 and os.path.getsize(self.path) < 512:
+            return None
+        archive = f"{self.path}.{datetime.now():%Y%m%d-%H%M%S-%f}.gz"
+        tmp_path = archive + ".tmp"
+        with open(self.path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+            while chunk := src.read(64 * 1024):
+                dst.write(chunk)
+        os.replace(tmp_path, archive)
+
+        manifest = self._load_manifest()
+        users = sorted(set(self._users) - {0})
+        manifest[os.path.basename(archive)] = {
+            "first_ts": self._stamps[0] if self._stamps else 0.0,
+            "last_ts": self._stamps[-1] if self._stamps else 0.0,
+            "entries": len(self._offsets),
+            "users": users if len(users) <= 5000 else None,
+        }
+        self._reset_sync(f"Log rotated into {os.path.basename(archive)}.")
+
+        archives = self.archives()
+        for old in archives[self.keep_archives:]:
+            os.remove(old)
+            manifest.pop(os.path.basename(old), None)
+        self._save_manifest(manifest)
+        return archive
+
+    def archives(self) -> List[str]:
+        """Archive paths, newest first"""
+        return sorted(glob.glob(glob.escape(self.path) + ".*.gz"), reverse=True)
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest: dict):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _reset_sync(self, note: str):
+        open(self.path, "wb").close()
+        open(self.index_path, "wb").close()
+        self._offsets, self._stamps, self._users = array("q"), array("d"), array("q")
+        self._append_index(self._write_sync([{"ts": round(time.time(), 3), "event": "note", "text": note}]))
+
+    # ---- index ----
+
+    def _load_index(self):
+        size = os.path.getsize(self.path)
+        try:
+            with open(self.index_path, "rb") as f:
+                raw = f.read()
+            if len(raw) % INDEX_RECORD.size:
+                raise ValueError("truncated index")
+            records = list(INDEX_RECORD.iter_unpack(raw))
+            if records:
+                with open(self.path, "rb") as f:
+                    f.seek(records[-1][0])
+                    f.readline()
+                    if f.tell() != size:
+                        raise ValueError("index out of sync")
+            elif size:
+                raise ValueError("index empty")
+            self._append_index(records)
+        except (OSError, ValueError):
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        records = []
+        last_ts = 0.0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    entry = parse_entry(line)
+                    last_ts = float(entry.get("ts") or last_ts)
+                    records.append((offset, last_ts, int(entry.get("user_id") or 0)))
+                offset += len(line)
+        with open(self.index_path, "wb") as f:
+            f.write(b"".join(INDEX_RECORD.pack(*r) for r in records))
+        self._offsets, self._stamps, self._users = array("q"), array("d"), array("q")
+        self._append_index(records)
+
+    # ---- reading ----
+
+    async def query(self, limit: int = 30, user_id: Optional[int] = None, since: Optional[float] = None,
+                    until: Optional[float] = None, text: Optional[str] = None) -> List[dict]:
+        """Newest matching entries, returned oldest first"""
+        await self.flush()
+        return await asyncio.to_thread(self._query_sync, limit, user_id, since, until, text)
+
+    def _query_sync(self, limit, user_id, since, until, text) -> List[dict]:
+        needle = text.lower() if text else None
+        found = []
+        with open(self.path, "rb") as f:
+            if user_id is None and since is None and until is None:
+                lines = read_lines_reverse(f)
+            else:
+                lines = self._indexed_lines(f, user_id, since, until)
+            self._collect(lines, found, limit, needle)
+        if len(found) < limit:
+            manifest = self._load_manifest()
+            for archive in self.archives():
+                meta = manifest.get(os.path.basename(archive))
+                if meta and not self._archive_may_match(meta, user_id, since, until):
+                    continue
+                with gzip.open(archive, "rb") as f:
+                    lines = reversed(f.read().splitlines())
+                    self._collect(lines, found, limit, needle, user_id, since, until)
+                if len(found) >= limit:
+                    break
+        found.reverse()
+        return found
+
+    @staticmethod
+    def _collect(lines, found, limit, needle, user_id=None, since=None, until=None):
+        for raw in lines:
+            if not raw.strip():
+                continue
+            if needle and needle not in raw.decode(errors="replace").lower():
+                continue
+            entry = parse_entry(raw)
+            if needle and needle not in str(entry.get("text", "")).lower() \
+                    and needle not in str(entry.get("username", "")).lower():
+                continue
+            if user_id is not None and entry.get("user_id") != user_id:
+                continue
+            ts = entry.get("ts") or 0.0
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts > until:
+                continue
+            found.append(entry)
+            if len(found) >= limit:
+                return
+
+    @staticmethod
+    def _archive_may_match(meta, user_id, since, until) -> bool:
+        if since is not None and meta["last_ts"] < since:
+            return False
+        if until is not None and meta["first_ts"] > until:
+            return False
+        if user_id is not None and meta.get("users") is not None and user_id not in meta["users"]:
+            return False
+        return True
+
+    def _indexed_lines(self, f, user_id, since, until) -> Iterator[bytes]:
+        offsets, stamps, users = self._offsets, self._stamps, self._users
+        count = min(len(offsets), len(stamps), len(users))
+        lo = bisect_left(stamps, since, 0, count) if since is not None else 0
+        hi = bisect_right(stamps, until, 0, count) if until is not None else count
+        for i in range(hi - 1, lo - 1, -1):
+            if user_id is not None and users[i] != user_id:
+                continue
+            f.seek(offsets[i])
+            yield f.readline()
+
+    def stats(self) -> dict:
+        archives = self.archives()
+        return {
+            "entries": len(self._offsets),
+            "buffered": len(self._buffer),
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "archives": len(archives),
+            "archive_bytes": sum(os.path.getsize(a) for a in archives),
+        }
@@ -0,0 +1,292 @@
+import json
+import operator
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne}
+RULE_TYPES = ("threshold", "rate")
+RULE_DEFAULTS = {
+    "for": 0,
+    "window": 300,
+    "cooldown": 600,
+    "repeat": 0,
+    "notify_clear": False,
+    "enabled": True,
+    "muted_until": 0,
+    "message": "⚠️ {name}: {metric} is {value} ({op} {threshold})",
+    "clear_message": "✅ {name} recovered: {metric} is {value}",
+}
+THROTTLED_BITS = {
+    "under_voltage": 0,
+    "freq_capped": 1,
+    "throttled": 2,
+    "soft_temp_limit": 3,
+    "under_voltage_occurred": 16,
+    "freq_capped_occurred": 17,
+    "throttled_occurred": 18,
+    "soft_temp_limit_occurred": 19,
+}
+
+
+def decode_throttled(bits: int) -> Dict[str, int]:
+    """Split the firmware's get_throttled bitmask into 0/1 sample fields"""
+    return {name: (bits >> bit) & 1 for name, bit in THROTTLED_BITS.items()}
+
+
+def validate_rule(rule: dict) -> dict:
+    """Fill defaults and check a rule definition; raises ValueError with a readable reason"""
+    if not isinstance(rule, dict):
+        raise ValueError("rule must be a JSON object")
+    for key in ("name", "metric", "op", "value"):
+        if key not in rule:
+            raise ValueError(f"missing field: {key}")
+    if not isinstance(rule["name"], str) or not rule["name"].strip() or " " in rule["name"]:
+        raise ValueError("name must be a non-empty word")
+    if rule.setdefault("type", "threshold") not in RULE_TYPES:
+        raise ValueError(f"type must be one of {', '.join(RULE_TYPES)}")
+    if rule["op"] not in OPS:
+        raise ValueError(f"op must be one of {' '.join(OPS)}")
+    rule = {**RULE_DEFAULTS, **rule}
+    rule.setdefault("clear", rule["value"])
+    for key in ("value", "clear", "for", "window", "cooldown", "repeat", "muted_until"):
+        if not isinstance(rule[key], (int, float)) or isinstance(rule[key], bool):
+            raise ValueError(f"{key} must be a number")
+    unknown = set(rule) - set(RULE_DEFAULTS) - {"name", "type", "metric", "op", "value", "clear"}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    sample = {"name": "", "metric": "", "op": "", "threshold": 0, "value": 0}
+    for key in ("message", "clear_message"):
+        try:
+            rule[key].format_map(sample)
+        except (KeyError, ValueError, IndexError, AttributeError) as e:
+            raise ValueError(f"{key} has a bad placeholder: {e}")
+    return rule
+
+
+class RuleState:
+    def __init__(self):
+        self.active = False
+        self.pending_since: Optional[float] = None
+        self.since: Optional[float] = None
+        self.last_value: Optional[float] = None
+        self.last_notified: Optional[float] = None
+        self.fired = 0
+        self.suppressed = 0
+
+
+class AlertEngine:
+    """Evaluates declarative alert rules over batches of telemetry samples.
+
+    A sample is a dict of numbers with a `ts`. `threshold` rules compare a
+    field, `rate` rules its change per minute over `window` seconds. A rule
+    fires once its condition has held for `for` seconds and clears only when
+    the value crosses back over `clear` (hysteresis). Notifications are sent
+    on transitions only, at most once per `cooldown`, with an optional
+    `repeat` reminder while still active. Rules are persisted as JSON and can
+    be edited at runtime.
+
+    Samples can carry a host (fleet mode): history and rule state are kept
+    per host and messages for a named host are prefixed with it.
+    """
+
+    def __init__(self, rules_path: str, default_rules: List[dict], history_seconds: float = 3600):
+        self.rules_path = rules_path
+        self.history_seconds = history_seconds
+        self.history: Dict[Optional[str], deque] = {}
+        self.rules: Dict[str, dict] = {}
+        self.states: Dict[Tuple[Optional[str], str], RuleState] = {}
+        self._batch: Dict[Optional[str], List[dict]] = {}
+        self._load(default_rules)
+
+    def _load(self, default_rules: List[dict]):
+        try:
+            with open(self.rules_path) as f:
+                rules = json.load(f)
+        except FileNotFoundError:
+            rules = default_rules
+        except Exception as e:
+            print(f"[alerts] Failed to load rules, using defaults: {e}")
+            rules = default_rules
+        for rule in rules:
+            try:
+                rule = validate_rule(dict(rule))
+            except ValueError as e:
+                print(f"[alerts] Skipping invalid rule {rule.get('name')!r}: {e}")
+                continue
+            self.rules[rule["name"]] = rule
+
+    def _save(self):
+        tmp_path = self.rules_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(list(self.rules.values()), f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.rules_path)
+        except Exception as e:
+            print(f"[alerts] Failed to save rules: {e}")
+
+    # ---- rule editing ----
+
+    def set_rule(self, rule: dict) -> dict:
+        rule = validate_rule(rule)
+        self.rules[rule["name"]] = rule
+        self._drop_states(rule["name"])
+        self._save()
+        return rule
+
+    def remove_rule(self, name: str) -> bool:
+        if self.rules.pop(name, None) is None:
+            return False
+        self._drop_states(name)
+        self._save()
+        return True
+
+    def update_rule(self, name: str, **fields) -> bool:
+        rule = self.rules.get(name)
+        if rule is None:
+            return False
+        rule.update(fields)
+        self._save()
+        return True
+
+    def _drop_states(self, name: str):
+        for key in [key for key in self.states if key[1] == name]:
+            del self.states[key]
+
+    # ---- evaluation ----
+
+    def add_sample(self, sample: dict, host: Optional[str] = None):
+        self._batch.setdefault(host, []).append(sample)
+        history = self.history.setdefault(host, deque())
+        history.append(sample)
+        while history and sample["ts"] - history[0]["ts"] > self.history_seconds:
+            history.popleft()
+
+    def compact_history(self, keep_recent: Optional[float] = None, step: float = 300) -> int:
+        """Thin out old samples to one per `step` seconds; returns how many were dropped.
+
+        Samples newer than `keep_recent` (default: the longest rate window
+        shorter than an hour) are kept, so short rate rules are unaffected and
+        long ones still see the start and end of their window.
+        """
+        if keep_recent is None:
+            windows = [r["window"] for r in self.rules.values() if r["type"] == "rate" and r["window"] < 3600]
+            keep_recent = max(windows, default=0) + step
+        dropped = 0
+        for host, history in self.history.items():
+            if not history:
+                continue
+            cutoff = history[-1]["ts"] - keep_recent
+            kept, last_kept = deque(), None
+            for sample in history:
+                if sample["ts"] >= cutoff or last_kept is None or sample["ts"] - last_kept >= step:
+                    kept.append(sample)
+                    last_kept = sample["ts"]
+            dropped += len(history) - len(kept)
+            self.history[host] = kept
+        return dropped
+
+    def _observe(self, rule: dict, sample: dict, history: deque) -> Optional[float]:
+        metric = rule["metric"]
+        if sample.get(metric) is None:
+            return None
+        if rule["type"] == "threshold":
+            return sample[metric]
+        window = [s for s in history if sample["ts"] - rule["window"] <= s["ts"] <= sample["ts"]
+                  and s.get(metric) is not None]
+        if len(window) < 2 or window[-1]["ts"] - window[0]["ts"] < rule["window"] / 2:
+            return None
+        first, last = window[0], window[-1]
+        return round((last[metric] - first[metric]) / (last["ts"] - first["ts"]) * 60, 2)
+
+    def evaluate(self, now: Optional[float] = None) -> List[Tuple[Optional[str], str]]:
+        """Run every rule over the samples gathered since the last call.
+
+        Returns `(key, message)` pairs to send. Firing and reminder messages of
+        the same rule and host share a key, so a newer one supersedes an older
+        one that could not be delivered yet; recovery messages have no key.
+        """
+        now = time.time() if now is None else now
+        batches, self._batch = self._batch, {}
+        messages = []
+        for host, batch in batches.items():
+            for name, rule in self.rules.items():
+                if rule["enabled"]:
+                    message = self._evaluate_rule(host, rule, batch, now)
+                    if message:
+                        fired, text = message
+                        key = f"alert:{host or 'local'}:{name}" if fired else None
+                        messages.append((key, f"[{host}] {text}" if host else text))
+        return messages
+
+    def _evaluate_rule(self, host: Optional[str], rule: dict, batch: List[dict],
+                       now: float) -> Optional[Tuple[bool, str]]:
+        state = self.states.setdefault((host, rule["name"]), RuleState())
+        was_active = state.active
+        fired_value = None
+        check = OPS[rule["op"]]
+        history = self.history.get(host, deque())
+        for sample in batch:
+            value = self._observe(rule, sample, history)
+            if value is None:
+                continue
+            state.last_value = value
+            if not state.active:
+                if not check(value, rule["value"]):
+                    state.pending_since = None
+                    continue
+                if state.pending_since is None:
+                    state.pending_since = sample["ts"]
+                if sample["ts"] - state.pending_since >= rule["for"]:
+                    state.active = True
+                    state.since = sample["ts"]
+                    state.fired += 1
+                    fired_value = value
+            elif not check(value, rule["clear"]):
+                state.active = False
+                state.pending_since = None
+        return self._notification(rule, state, was_active, fired_value, now)
+
+    def _notification(self, rule: dict, state: RuleState, was_active: bool, fired_value,
+                      now: float) -> Optional[Tuple[bool, str]]:
+        """`(is_firing, text)` for the transition this evaluation produced, if any"""
+        if rule["muted_until"] > now:
+            return None
+        fields = {
+            "name": rule["name"], "metric": rule["metric"], "op": rule["op"], "threshold": rule["value"],
+            "value": state.last_value if fired_value is None else fired_value,
+        }
+        cooling = state.last_notified is not None and now - state.last_notified < rule["cooldown"]
+        if fired_value is not None:
+            if cooling:
+                state.suppressed += 1
+                return None
+            state.last_notified = now
+            text = rule["message"].format_map(fields)
+            return True, text if state.active else text + " (already recovered)"
+        if state.active and rule["repeat"] and now - (state.last_notified or 0) >= rule["repeat"]:
+            state.last_notified = now
+            return True, "🔁 " + rule["message"].format_map(fields)
+        if was_active and not state.active and rule["notify_clear"]:
+            return False, rule["clear_message"].format_map(fields)
+        return None
+
+    def status(self, host: Optional[str] = None) -> List[dict]:
+        """One row per rule; `last_value` is for `host`, `active_hosts` lists every host where it fires"""
+        rows = []
+        now = time.time()
+        for name, rule in self.rules.items():
+            states = {key[0]: state for key, state in self.states.items() if key[1] == name}
+            state = states.get(host) or RuleState()
+            rows.append({
+                "rule": rule,
+                "active": state.active,
+                "active_hosts": sorted(h or "local" for h, s in states.items() if s.active),
+                "since": state.since if state.active else None,
+                "last_value": state.last_value,
+                "fired": sum(s.fired for s in states.values()),
+                "suppressed": sum(s.suppressed for s in states.values()),
+                "muted": rule["muted_until"] > now,
+            })
+        return rows
@@ -0,0 +1,182 @@
+import asyncio
+import hmac
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from alerts import decode_throttled
+
+# Agents send short keys to keep each push a few hundred bytes
+COMPACT_KEYS = {
+    "h": "host",
+    "t": "ts",
+    "ct": "cpu_temp",
+    "ld": "load",
+    "m": "memory",
+    "d": "disk",
+    "w": "wifi",
+    "th": "throttled",
+    "up": "uptime",
+    "ip": "ip",
+}
+
+
+def expand(payload: dict) -> dict:
+    return {COMPACT_KEYS.get(key, key): value for key, value in payload.items()}
+
+
+def to_sample(telemetry: dict, received: float) -> dict:
+    """Alert-engine sample from expanded agent telemetry; timestamps use this bot's clock"""
+    sample = {"ts": received, "online": 1}
+    for key in ("cpu_temp", "wifi"):
+        if telemetry.get(key) is not None:
+            sample[key] = telemetry[key]
+    if telemetry.get("throttled") is not None:
+        sample.update(decode_throttled(int(telemetry["throttled"])))
+    for key in ("memory", "disk"):
+        used_total = telemetry.get(key)
+        if used_total and used_total[1]:
+            sample[f"{key}_used_pct"] = round(used_total[0] / used_total[1] * 100, 1)
+    return sample
+
+
+class Node:
+    def __init__(self, name: str, url: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.telemetry: Optional[dict] = None
+        self.received_at: Optional[float] = None
+        # A node that never answered is stale `stale_after` seconds after it was registered
+        self.registered_at = time.time()
+        self.latency: Optional[float] = None
+        self.error: Optional[str] = None
+        self.offline_reported = False
+
+    @property
+    def mode(self) -> str:
+        return "poll" if self.url else "push"
+
+
+class FleetRegistry:
+    """Telemetry from the other Pis of the fleet.
+
+    Agents either push to `POST /fleet/push` or are polled concurrently at
+    `GET <url>/telemetry`; both use the shared bearer token. Every reading is
+    handed to `on_sample(host, sample)` for alerting, and a node that stays
+    silent for `stale_after` seconds produces an `online: 0` sample.
+    """
+
+    def __init__(self, token: str, nodes: Optional[Dict[str, str]] = None, stale_after: float = 180.0,
+                 on_sample: Optional[Callable[[str, dict], None]] = None, request_timeout: float = 5.0):
+        self.token = token
+        self.stale_after = stale_after
+        self.on_sample = on_sample
+        self.request_timeout = request_timeout
+        self.nodes: Dict[str, Node] = {name: Node(name, url.rstrip("/")) for name, url in (nodes or {}).items()}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _record(self, node: Node, telemetry: dict):
+        node.telemetry = telemetry
+        node.received_at = time.time()
+        node.error = None
+        node.offline_reported = False
+        if self.on_sample:
+            self.on_sample(node.name, to_sample(telemetry, node.received_at))
+
+    def accept(self, payload: dict) -> Node:
+        telemetry = expand(payload)
+        name = str(telemetry.get("host") or "").strip()
+        if not name:
+            raise ValueError("telemetry without host")
+        node = self.nodes.get(name)
+        if node is None:
+            node = self.nodes[name] = Node(name)
+        self._record(node, telemetry)
+        return node
+
+    def authorized(self, header: Optional[str]) -> bool:
+        return bool(header) and hmac.compare_digest(header, f"Bearer {self.token}")
+
+    # ---- polling ----
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    async def _poll_node(self, node: Node):
+        started = time.monotonic()
+        try:
+            async with self._get_session().get(f"{node.url}/telemetry") as resp:
+                resp.raise_for_status()
+                payload = await resp.json(content_type=None)
+            node.latency = time.monotonic() - started
+            self._record(node, expand(payload))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            node.error = str(e) or type(e).__name__
+
+    async def poll(self, budget: Optional[float] = None) -> List[str]:
+        """Poll every pull-mode node at once; returns the names that missed the budget.
+
+        Late requests keep running in the background and update the node when
+        they finish.
+        """
+        tasks = {asyncio.create_task(self._poll_node(node)): node.name
+                 for node in self.nodes.values() if node.url}
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=budget)
+        return sorted(tasks[task] for task in pending)
+
+    def check_stale(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        for node in self.nodes.values():
+            seen = node.received_at or node.registered_at
+            if now - seen >= self.stale_after and not node.offline_reported:
+                node.offline_reported = True
+                if self.on_sample:
+                    self.on_sample(node.name, {"ts": now, "online": 0})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    # ---- push endpoint ----
+
+    def build_app(self) -> web.Application:
+        async def push(request: web.Request) -> web.Response:
+            if not self.authorized(request.headers.get("Authorization")):
+                return web.json_response({"ok": False, "error": "unauthorized"}, status=401)
+            try:
+                node = self.accept(json.loads(await request.read()))
+            except (ValueError, AttributeError) as e:
+                return web.json_response({"ok": False, "error": str(e)}, status=400)
+            return web.json_response({"ok": True, "host": node.name})
+
+        app = web.Application(client_max_size=64 * 1024)
+        app.router.add_post("/fleet/push", push)
+        return app
+
+
+async def start_fleet_server(registry: FleetRegistry, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(registry.build_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[fleet] Accepting agent pushes on {host}:{port}/fleet/push")
+    return runner
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """`pi2=http://10.0.0.12:9101,pi3=http://10.0.0.13:9101` -> {name: url}"""
+    nodes = {}
+    for item in spec.split(","):
+        name, _, url = item.strip().partition("=")
+        if name and url:
+            nodes[name.strip()] = url.strip()
+    return nodes
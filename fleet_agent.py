@@ -0,0 +1,145 @@
+"""Lightweight telemetry agent for the other Raspberry Pis of the fleet.
+
+Standard library only, so it runs on a bare Raspberry Pi OS install. Either
+pushes compact telemetry to the bot, or serves it for the bot to poll:
+
+    FLEET_TOKEN=... python3 fleet_agent.py --push http://bot-pi:9102/fleet/push
+    FLEET_TOKEN=... python3 fleet_agent.py --serve 0.0.0.0:9101
+"""
+import argparse
+import hmac
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+THROTTLED_SYSFS_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+
+def read_first(path_, convert=str):
+    try:
+        with open(path_) as f:
+            return convert(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def read_throttled():
+    value = read_first(THROTTLED_SYSFS_PATH, lambda text: int(text, 16))
+    if value is None and shutil.which("vcgencmd"):
+        match = re.search(r"throttled=(0x[0-9a-fA-F]+)", subprocess.getoutput("vcgencmd get_throttled"))
+        value = int(match.group(1), 16) if match else None
+    return value
+
+
+def read_memory():
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                info[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    if "MemTotal" not in info:
+        return None
+    return [info["MemTotal"] - info.get("MemAvailable", info.get("MemFree", 0)), info["MemTotal"]]
+
+
+def read_ip():
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+def collect(name):
+    disk = shutil.disk_usage("/")
+    temp = read_first("/sys/class/thermal/thermal_zone0/temp", int)
+    operstate = read_first("/sys/class/net/wlan0/operstate")
+    telemetry = {
+        "h": name,
+        "t": round(time.time()),
+        "ct": None if temp is None else round(temp / 1000, 1),
+        "ld": [round(x, 2) for x in os.getloadavg()],
+        "m": read_memory(),
+        "d": [disk.used, disk.total],
+        "w": None if operstate is None else int(operstate == "up"),
+        "th": read_throttled(),
+        "up": read_first("/proc/uptime", lambda text: int(float(text.split()[0]))),
+        "ip": read_ip(),
+    }
+    return {key: value for key, value in telemetry.items() if value is not None}
+
+
+def push_forever(url, token, name, interval):
+    failures = 0
+    while True:
+        body = json.dumps(collect(name), separators=(",", ":")).encode()
+        request = urllib.request.Request(url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as resp:
+                resp.read()
+            failures = 0
+        except (urllib.error.URLError, OSError) as e:
+            failures += 1
+            print(f"[agent] Push failed ({failures}x): {e}")
+        if failures:
+            # Back off while the bot is unreachable
+            time.sleep(interval * min(2 ** failures, 8))
+        else:
+            # Stay aligned to wall-clock multiples of the interval
+            time.sleep(interval - time.time() % interval)
+
+
+def serve_forever(address, token, name):
+    host, _, port = address.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/telemetry":
+                self.send_error(404)
+                return
+            if not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+                self.send_error(401)
+                return
+            body = json.dumps(collect(name), separators=(",", ":")).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print(f"[agent] Serving /telemetry on {host or '0.0.0.0'}:{port}")
+    ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--push", metavar="URL", help="bot push endpoint, e.g. http://bot-pi:9102/fleet/push")
+    mode.add_argument("--serve", metavar="HOST:PORT", help="serve GET /telemetry for the bot to poll")
+    parser.add_argument("--name", default=socket.gethostname(), help="host name shown in the bot")
+    parser.add_argument("--interval", type=float, default=30, help="push interval in seconds")
+    parser.add_argument("--token", default=os.getenv("FLEET_TOKEN"), help="shared token (default $FLEET_TOKEN)")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("a token is required (--token or FLEET_TOKEN)")
+    if args.push:
+        push_forever(args.push, args.token, args.name, args.interval)
+    else:
+        serve_forever(args.serve, args.token, args.name)
@@ -0,0 +1,256 @@
+import asyncio
+import html
+import json
+import os
+import statistics
+import time
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Union
+
+from streaming import StreamedProcess
+
+FINISHED = ("succeeded", "failed", "interrupted")
+
+
+class Step:
+    """One command of a job; `stop_if_empty` ends the job early when the command prints nothing"""
+
+    def __init__(
+        self,
+        name: str,
+        cmd: Union[str, Sequence[str]],
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        stop_if_empty: bool = False,
+        empty_message: str = "Nothing to do.",
+    ):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.timeout = timeout
+        self.stop_if_empty = stop_if_empty
+        self.empty_message = empty_message
+
+
+class Job:
+    def __init__(self, job_id: int, kind: str, resource: str, title: str, step_names: List[str]):
+        self.id = job_id
+        self.kind = kind
+        self.resource = resource
+        self.title = title
+        self.status = "queued"
+        self.note = ""
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.steps = [{"name": name, "status": "pending"} for name in step_names]
+        self.current: Optional[StreamedProcess] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "resource": self.resource,
+            "title": self.title,
+            "status": self.status,
+            "note": self.note,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "steps": self.steps,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data["id"], data["kind"], data["resource"], data["title"], [])
+        job.status = data["status"]
+        job.note = data.get("note", "")
+        job.created = data["created"]
+        job.started = data.get("started")
+        job.finished = data.get("finished")
+        job.steps = data.get("steps", [])
+        return job
+
+
+class JobRegistry:
+    """Runs maintenance commands as background jobs.
+
+    Jobs touching the same resource are serialized by a per-resource lock,
+    progress is reported step by step, durations are kept per job kind, and
+    state is persisted so a restart marks unfinished jobs as interrupted.
+    """
+
+    def __init__(self, state_path: str, keep_jobs: int = 50, keep_durations: int = 20):
+        self.state_path = state_path
+        self.keep_jobs = keep_jobs
+        self.keep_durations = keep_durations
+        self.jobs: Dict[int, Job] = {}
+        self.durations: Dict[str, deque] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+        self._next_id = 1
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"[jobs] Failed to load state: {e}")
+            return
+        for data in state.get("jobs", []):
+            job = Job.from_dict(data)
+            if job.status not in FINISHED:
+                job.status = "interrupted"
+                job.note = "bot restarted while the job was running"
+                job.finished = job.finished or time.time()
+            self.jobs[job.id] = job
+        for kind, values in state.get("durations", {}).items():
+            self.durations[kind] = deque(values, maxlen=self.keep_durations)
+        self._next_id = max(self.jobs, default=0) + 1
+        self._save()
+
+    def _save(self):
+        jobs = sorted(self.jobs.values(), key=lambda j: j.id)[-self.keep_jobs:]
+        self.jobs = {job.id: job for job in jobs}
+        state = {
+            "jobs": [job.to_dict() for job in jobs],
+            "durations": {kind: list(values) for kind, values in self.durations.items()},
+        }
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print(f"[jobs] Failed to save state: {e}")
+
+    def expected_duration(self, kind: str) -> Optional[float]:
+        values = self.durations.get(kind)
+        return statistics.median(values) if values else None
+
+    def is_busy(self, resource: str) -> bool:
+        lock = self._locks.get(resource)
+        return bool(lock and lock.locked())
+
+    def recent(self, limit: int = 10) -> List[Job]:
+        return sorted(self.jobs.values(), key=lambda j: j.id, reverse=True)[:limit]
+
+    def submit(
+        self,
+        kind: str,
+        resource: str,
+        title: str,
+        steps: List[Step],
+        on_progress: Optional[Callable[[Job], Awaitable[None]]] = None,
+    ) -> Job:
+        job = Job(self._next_id, kind, resource, title, [step.name for step in steps])
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self._save()
+        task = asyncio.create_task(self._run(job, steps, on_progress))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _notify(self, job: Job, on_progress):
+        if on_progress:
+            try:
+                await on_progress(job)
+            except Exception as e:
+                print(f"[jobs] Progress callback failed for job {job.id}: {e}")
+
+    async def _run(self, job: Job, steps: List[Step], on_progress):
+        lock = self._locks.setdefault(job.resource, asyncio.Lock())
+        if lock.locked():
+            job.note = f"waiting for {job.resource}"
+            await self._notify(job, on_progress)
+        async with lock:
+            job.status = "running"
+            job.note = ""
+            job.started = time.time()
+            self._save()
+            await self._notify(job, on_progress)
+            outcome = "succeeded"
+            try:
+                for step, state in zip(steps, job.steps):
+                    state["status"] = "running"
+                    await self._notify(job, on_progress)
+                    proc = StreamedProcess(step.cmd, shell=isinstance(step.cmd, str), cwd=step.cwd, tail_bytes=1000)
+                    job.current = proc
+                    try:
+                        await proc.start()
+                        rc = await proc.run(
+                            timeout=step.timeout,
+                            on_update=lambda _: self._notify(job, on_progress),
+                        )
+                    finally:
+                        proc.cleanup()
+                        job.current = None
+                    state.update(
+                        status="ok" if rc == 0 else "failed",
+                        rc=rc,
+                        seconds=round(proc.elapsed, 2),
+                        output=proc.tail()[-1000:],
+                    )
+                    if proc.timed_out:
+                        state["status"] = "timeout"
+                    if state["status"] != "ok":
+                        outcome = "failed"
+                        break
+                    if step.stop_if_empty and not proc.tail().strip():
+                        job.note = step.empty_message
+                        break
+            except Exception as e:
+                outcome = "failed"
+                job.note = str(e)
+                for state in job.steps:
+                    if state["status"] == "running":
+                        state["status"] = "failed"
+            finally:
+                job.status = outcome
+                job.finished = time.time()
+                if job.status == "succeeded" and not job.note:
+                    self.durations.setdefault(job.kind, deque(maxlen=self.keep_durations)).append(
+                        round(job.duration, 2)
+                    )
+                self._save()
+        await self._notify(job, on_progress)
+
+
+def describe_job(job: Job, expected: Optional[float] = None) -> str:
+    icons = {"pending": "▫️", "running": "⏳", "ok": "✅", "failed": "❌", "timeout": "⏱"}
+    status_icons = {"queued": "🕒", "running": "⏳", "succeeded": "✅", "failed": "❌", "interrupted": "⚠️"}
+    lines = [f"{status_icons.get(job.status, '•')} <b>Job #{job.id}</b> {html.escape(job.title)} — {job.status}"]
+    if job.duration is not None:
+        eta = f" (usually ~{expected:.0f}s)" if expected and job.status == "running" else ""
+        lines[0] += f", {job.duration:.1f}s{eta}"
+    if job.note:
+        lines.append(f"ℹ️ {html.escape(job.note)}")
+    output = None
+    for step in job.steps:
+        seconds = f" {step['seconds']}s" if "seconds" in step else ""
+        rc = f" rc={step['rc']}" if step.get("rc") not in (None, 0) else ""
+        lines.append(f"{icons.get(step['status'], '•')} {html.escape(step['name'])}{seconds}{rc}")
+        if step["status"] in ("failed", "timeout"):
+            output = step.get("output")
+    if job.current is not None:
+        output = job.current.tail()
+    elif output is None and job.status == "succeeded" and job.steps:
+        output = job.steps[-1].get("output")
+    if output and output.strip():
+        lines.append(f"<code>{html.escape(output.strip()[-700:])}</code>")
+    return "\n".join(lines)
+
+
+def started_at(job: Job) -> str:
+    return datetime.fromtimestamp(job.created).strftime("%d.%m %H:%M")
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from wakeonlan import send_magic_packet
+
+from perf import percentile
+
+OS_COMMANDS = {
+    "windows": {"shutdown": ["shutdown", "/s", "/t", "0"], "lock": ["schtasks", "/run", "/tn", "LockNow"]},
+    "linux": {"shutdown": ["sudo", "systemctl", "poweroff"], "lock": ["loginctl", "lock-sessions"]},
+}
+# Seconds after the first wake burst at which the burst is repeated
+WAKE_BURSTS = (0, 2, 5, 10, 20, 40)
+
+
+class Machine:
+    def __init__(self, name: str, mac: str, ip: str, ssh_user: str, ssh_key: str, ssh_port: int = 22,
+                 broadcast: Sequence[str] = ("255.255.255.255",), groups: Sequence[str] = (),
+                 os: str = "windows", shutdown_cmd: Optional[List[str]] = None, lock_cmd: Optional[List[str]] = None,
+                 encoding: Optional[str] = None):
+        if os not in OS_COMMANDS:
+            raise ValueError(f"{name}: os must be one of {', '.join(OS_COMMANDS)}")
+        self.name = name
+        self.mac = mac
+        self.ip = ip
+        self.ssh_user = ssh_user
+        self.ssh_key = ssh_key
+        self.ssh_port = int(ssh_port)
+        self.broadcast = list(broadcast)
+        self.groups = list(groups)
+        self.os = os
+        self.shutdown_cmd = shutdown_cmd or OS_COMMANDS[os]["shutdown"]
+        self.lock_cmd = lock_cmd or OS_COMMANDS[os]["lock"]
+        self.encoding = encoding or ("cp1251" if os == "windows" else "utf-8")
+
+    @property
+    def target(self) -> str:
+        return f"{self.ssh_user}@{self.ip}"
+
+
+class MachineRegistry:
+    """PCs the bot can wake, shut down and lock.
+
+    Machines come from a JSON file (`{"machines": [...]}`) with per-host SSH
+    credentials, broadcast addresses and groups; without the file there is a
+    single `pc` built from the environment. Measured boot times are kept per
+    machine to report percentiles and predict when a waking PC will be ready.
+    """
+
+    def __init__(self, config_path: str, history_path: str, default: dict, keep_boots: int = 50):
+        self.config_path = config_path
+        self.history_path = history_path
+        self.keep_boots = keep_boots
+        self.machines: Dict[str, Machine] = {}
+        self.boot_history: Dict[str, List[float]] = {}
+        self._load(default)
+
+    def _load(self, default: dict):
+        try:
+            with open(self.config_path) as f:
+                entries = json.load(f)["machines"]
+        except FileNotFoundError:
+            entries = [default]
+        for entry in entries:
+            machine = Machine(**entry)
+            self.machines[machine.name] = machine
+        try:
+            with open(self.history_path) as f:
+                self.boot_history = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[machines] Failed to load boot history: {e}")
+
+    def _save_history(self):
+        tmp_path = self.history_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.boot_history, f)
+            os.replace(tmp_path, self.history_path)
+        except Exception as e:
+            print(f"[machines] Failed to save boot history: {e}")
+
+    @property
+    def default(self) -> Machine:
+        return self.machines.get("pc") or next(iter(self.machines.values()))
+
+    def groups(self) -> Dict[str, List[str]]:
+        found: Dict[str, List[str]] = {}
+        for machine in self.machines.values():
+            for group in machine.groups:
+                found.setdefault(group, []).append(machine.name)
+        return found
+
+    def resolve(self, target: str) -> List[Machine]:
+        """Machine name, group name or `all`; empty means the default machine"""
+        target = target.strip()
+        if not target:
+            return [self.default]
+        if target == "all":
+            return list(self.machines.values())
+        if target in self.machines:
+            return [self.machines[target]]
+        members = [m for m in self.machines.values() if target in m.groups]
+        if not members:
+            raise KeyError(target)
+        return members
+
+    # ---- boot statistics ----
+
+    def record_boot(self, machine: Machine, seconds: float):
+        history = self.boot_history.setdefault(machine.name, [])
+        history.append(round(seconds, 1))
+        del history[:-self.keep_boots]
+        self._save_history()
+
+    def boot_stats(self, machine: Machine) -> Optional[Dict[str, float]]:
+        values = sorted(self.boot_history.get(machine.name, []))
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "max": values[-1],
+        }
+
+    def expected_boot(self, machine: Machine) -> Optional[float]:
+        """Time by which the machine has been ready in 90% of recorded boots"""
+        stats = self.boot_stats(machine)
+        return stats["p90"] if stats else None
+
+    # ---- power control ----
+
+    @staticmethod
+    async def is_online(machine: Machine, timeout: float = 1.0) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(machine.ip, machine.ssh_port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def wait_for(self, machine: Machine, online: bool, timeout: float, interval: float = 1.0) -> Optional[float]:
+        """Seconds until the machine reached the requested state, or None on timeout"""
+        started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            if await self.is_online(machine) == online:
+                return time.monotonic() - started
+            await asyncio.sleep(interval)
+        return None
+
+    @staticmethod
+    def _send_burst(machine: Machine):
+        for address in machine.broadcast:
+            for port in (9, 7):
+                send_magic_packet(machine.mac, ip_address=address, port=port)
+
+    async def wake(self, machine: Machine, timeout: float = 120.0) -> Optional[float]:
+        """Send magic-packet bursts until the machine answers; returns the boot time and records it"""
+        started = time.monotonic()
+        waiter = asyncio.create_task(self.wait_for(machine, online=True, timeout=timeout))
+        try:
+            for offset in WAKE_BURSTS:
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    done, _ = await asyncio.wait({waiter}, timeout=delay)
+                    if done:
+                        break
+                await asyncio.to_thread(self._send_burst, machine)
+            seconds = await waiter
+        finally:
+            waiter.cancel()
+        if seconds is not None:
+            self.record_boot(machine, seconds)
+        return seconds
+
+    @staticmethod
+    async def ssh(machine: Machine, command: Sequence[str], timeout: float = 30.0) -> Tuple[int, str, str]:
+        proc = await asyncio.create_subprocess_exec(
+            "ssh", "-i", machine.ssh_key, "-p", str(machine.ssh_port),
+            "-o", "BatchMode=yes", "-o", "ConnectTimeout=5",
+            machine.target, *command,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, stdin=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return 124, "", f"Timeout after {timeout:.0f}s"
+        decode = lambda data: data.decode(machine.encoding, errors="replace").strip()
+        return proc.returncode, decode(out), decode(err)
+
+    async def shutdown(self, machine: Machine, timeout: float = 60.0) -> Tuple[bool, str]:
+        rc, _, err = await self.ssh(machine, machine.shutdown_cmd)
+        if rc != 0:
+            return False, err or f"ssh exited with {rc}"
+        seconds = await self.wait_for(machine, online=False, timeout=timeout)
+        if seconds is None:
+            return False, f"still online after {timeout:.0f}s"
+        return True, f"off in {seconds:.1f}s"
+
+    async def lock(self, machine: Machine) -> Tuple[bool, str]:
+        rc, out, err = await self.ssh(machine, machine.lock_cmd)
+        return rc == 0, (err or out) if rc != 0 else "locked"
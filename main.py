@@ -1,22 +1,42 @@
 import asyncio
 import base64
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile, BufferedInputFile
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from os import getenv, popen, path, makedirs
 import os
 from dotenv import load_dotenv
-from functools import wraps
-from wakeonlan import send_magic_packet
+from functools import partial, wraps
 import psutil
 import platform
 import time
 import socket
 import subprocess
+import shutil
 import re
+import json
+import html
+import itertools
 import requests
 from datetime import datetime, timedelta
-from social_media import SocialMediaDownloader
+from social_media import SocialMediaDownloader, quality_format
+from webhook import UpdateRecorder, run_webhook
+from metrics import Metrics, start_metrics_server
+from perf import HandlerStats, HandlerTimer, LoopLagMonitor
+from streaming import StreamedProcess
+from jobs import JobRegistry, Step, describe_job, started_at
+from access_log import AccessLog
+from scheduler import Scheduler
+from alerts import AlertEngine, decode_throttled
+from smart import SmartSampler, format_age, parse_devices
+from fleet import FleetRegistry, expand, parse_nodes, start_fleet_server
+from machines import MachineRegistry
+from outbox import Outbox
+from memprofile import MemoryProfiler, short_site
+from pull import RemoteFile, SFTPInputFile, asyncssh, looks_like_text, plan_parts, remote_basename
+import fleet_agent
 
 load_dotenv()
 
@@ -35,24 +55,174 @@ PC_IP = require_env("PC_IP")
 SECRET_KEY = require_env("SECRET_KEY")
 OPENWEATHER_KEY = getenv("OPENWEATHER_KEY")
 CITY_ID = getenv("CITY_ID")
+OPENWEATHER_BASE = getenv("OPENWEATHER_BASE", "https://api.openweathermap.org").rstrip("/")
+CURRENCY_API_BASE = getenv("CURRENCY_API_BASE", "https://open.er-api.com").rstrip("/")
 LOG_FILE_PATH = require_env("LOG_FILE_PATH")
 SSH_KEY = require_env("SSH_KEY_PATH")
 SSH_USER = require_env("SSH_USER")
 WEBUI_BASE = require_env("WEBUI_BASE")
 UPDATE_SCRIPT_PATH = require_env("UPDATE_SCRIPT_PATH")
 WAKE_TRIGGER_BASE = require_env("WAKE_TRIGGER_BASE")
+SD_API_BASE = getenv("SD_API_BASE", f"http://{PC_IP}:7860").rstrip("/")
+BOT_MODE = getenv("BOT_MODE", "polling").lower()
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(getenv("WEBHOOK_PORT", "8080"))
+RECORD_UPDATES_PATH = getenv("RECORD_UPDATES_PATH")
+METRICS_PORT = getenv("METRICS_PORT")
+METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+METRICS_INTERVAL = float(getenv("METRICS_INTERVAL", "30"))
+LOOP_LAG_INTERVAL = float(getenv("LOOP_LAG_INTERVAL", "1"))
+LOOP_LAG_THRESHOLD_MS = float(getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+EXEC_TIMEOUT = float(getenv("EXEC_TIMEOUT", "120"))
+EXEC_EDIT_INTERVAL = float(getenv("EXEC_EDIT_INTERVAL", "2"))
+EXEC_TAIL_BYTES = 3500
+JOB_STEP_TIMEOUT = float(getenv("JOB_STEP_TIMEOUT", "900"))
+LOG_MAX_BYTES = int(getenv("LOG_MAX_BYTES", str(1024 * 1024)))
+LOG_KEEP_ARCHIVES = int(getenv("LOG_KEEP_ARCHIVES", "14"))
+LOG_ROTATE_HOURS = [int(h) for h in getenv("LOG_ROTATE_HOURS", "0,12").split(",") if h.strip()]
+TEMPERATURE_THRESHOLD = float(getenv("TEMPERATURE_THRESHOLD", "60"))
+WAKE_TRIGGER_INTERVAL = float(getenv("WAKE_TRIGGER_INTERVAL", "3"))
+SCHEDULER_COALESCE = float(getenv("SCHEDULER_COALESCE", "1"))
+SCHEDULER_JITTER = float(getenv("SCHEDULER_JITTER", "1"))
+ALERT_SAMPLE_INTERVAL = float(getenv("ALERT_SAMPLE_INTERVAL", "10"))
+ALERT_EVAL_INTERVAL = float(getenv("ALERT_EVAL_INTERVAL", "30"))
+SMART_INTERVAL = float(getenv("SMART_INTERVAL", getenv("METRICS_SMART_INTERVAL", "1800")))
+SMART_DEVICES = getenv("SMART_DEVICES")
+SMART_TEMP_WARN = float(getenv("SMART_TEMP_WARN", "50"))
+OUTBOX_SEND_INTERVAL = float(getenv("OUTBOX_SEND_INTERVAL", "1"))
+OUTBOX_MAX_ENTRIES = int(getenv("OUTBOX_MAX_ENTRIES", "200"))
+OUTBOX_UPLOAD_TIMEOUT = float(getenv("OUTBOX_UPLOAD_TIMEOUT", "600"))
+OUTBOX_UPLOAD_ATTEMPTS = int(getenv("OUTBOX_UPLOAD_ATTEMPTS", "5"))
+PREVIEW_TTL = float(getenv("PREVIEW_TTL", "1800"))
+MEM_TRACE = getenv("MEM_TRACE", "0") == "1"
+MEM_TRACE_FRAMES = int(getenv("MEM_TRACE_FRAMES", "8"))
+MEM_SOFT_LIMIT_MB = float(getenv("MEM_SOFT_LIMIT_MB", "0"))
+MEM_SAMPLE_INTERVAL = float(getenv("MEM_SAMPLE_INTERVAL", "60"))
+PULL_PART_BYTES = int(getenv("PULL_PART_BYTES", str(49 * 1024 * 1024)))
+PULL_COMPRESS_MIN = int(getenv("PULL_COMPRESS_MIN", str(32 * 1024)))
+PULL_UPLOAD_TIMEOUT = int(getenv("PULL_UPLOAD_TIMEOUT", "900"))
+FLEET_PORT = getenv("FLEET_PORT")
+FLEET_HOST = getenv("FLEET_HOST", "0.0.0.0")
+FLEET_NODES = getenv("FLEET_NODES")
+FLEET_NAME = getenv("FLEET_NAME", platform.node())
+FLEET_POLL_INTERVAL = float(getenv("FLEET_POLL_INTERVAL", "30"))
+FLEET_STALE_AFTER = float(getenv("FLEET_STALE_AFTER", "180"))
+FLEET_STATUS_BUDGET = float(getenv("FLEET_STATUS_BUDGET", "2.5"))
+
+memory_profiler = MemoryProfiler(
+    soft_limit=int(MEM_SOFT_LIMIT_MB * 1024 * 1024) or None, frames=MEM_TRACE_FRAMES
+)
+if MEM_TRACE:
+    # Started before the rest of the bot is built so its allocations are attributed too
+    memory_profiler.start()
 
 log_dir = path.dirname(LOG_FILE_PATH)
+PERF_DUMP_PATH = getenv("PERF_DUMP_PATH", path.join(log_dir, "perf.json"))
+JOBS_STATE_PATH = getenv("JOBS_STATE_PATH", path.join(log_dir, "jobs.json"))
+MACHINES_PATH = getenv("MACHINES_PATH", path.join(log_dir, "machines.json"))
+BOOT_HISTORY_PATH = getenv("BOOT_HISTORY_PATH", path.join(log_dir, "boot_history.json"))
+SMART_CACHE_PATH = getenv("SMART_CACHE_PATH", path.join(log_dir, "smart.json"))
+ALERT_RULES_PATH = getenv("ALERT_RULES_PATH", path.join(log_dir, "alert_rules.json"))
+OUTBOX_PATH = getenv("OUTBOX_PATH", path.join(log_dir, "outbox.json"))
+THROTTLED_SYSFS_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+VCGENCMD = shutil.which("vcgencmd")
+
+DEFAULT_ALERT_RULES = [
+    {"name": "cpu_hot", "metric": "cpu_temp", "op": ">", "value": TEMPERATURE_THRESHOLD,
+     "clear": TEMPERATURE_THRESHOLD - 5, "cooldown": 1800,
+     "message": "🔥 Warning! Temperature {value}°C exceeded threshold {threshold}°C."},
+    {"name": "cpu_heating_fast", "type": "rate", "metric": "cpu_temp", "op": ">", "value": 5, "clear": 1,
+     "window": 180, "cooldown": 1800,
+     "message": "📈 Temperature is climbing {value}°C/min."},
+    {"name": "wifi_down", "metric": "wifi", "op": "<", "value": 1, "for": 30, "notify_clear": True,
+     "message": "🛜 Warning! Wi-Fi disconnected.", "clear_message": "🛜 Wi-Fi is back."},
+    {"name": "under_voltage", "metric": "under_voltage", "op": ">", "value": 0, "for": 20, "cooldown": 3600,
+     "message": "🔌 Under-voltage detected — check the power supply."},
+    {"name": "throttled", "metric": "throttled", "op": ">", "value": 0, "for": 60, "cooldown": 3600,
+     "message": "🐢 The SoC is being throttled."},
+    {"name": "disk_hot", "metric": "disk_temp_max", "op": ">=", "value": SMART_TEMP_WARN,
+     "clear": SMART_TEMP_WARN - 5, "cooldown": 3600,
+     "message": "💽 Disk temperature {value}°C (≥ {threshold}°C)."},
+    {"name": "disk_errors_growing", "metric": "disk_errors_grew", "op": ">", "value": 0, "cooldown": 86400,
+     "message": "💽 SMART error counters are growing — see /disk_health."},
+    {"name": "node_offline", "metric": "online", "op": "<", "value": 1, "notify_clear": True, "cooldown": 0,
+     "message": "📴 No telemetry received for a while.", "clear_message": "📶 Reporting again."},
+]
 
 makedirs(log_dir, exist_ok=True)
 
-if not path.exists(LOG_FILE_PATH):
-    with open(LOG_FILE_PATH, "w") as f:
-        f.write(f"[{datetime.now()}] Log file created automatically.\n")
+access_log = AccessLog(LOG_FILE_PATH, max_bytes=LOG_MAX_BYTES, keep_archives=LOG_KEEP_ARCHIVES)
 
 pending_update_confirmation = {}
+running_execs = {}
+job_registry = JobRegistry(JOBS_STATE_PATH)
+scheduler = Scheduler(coalesce=SCHEDULER_COALESCE)
+alert_engine = AlertEngine(ALERT_RULES_PATH, DEFAULT_ALERT_RULES)
+outbox = Outbox(OUTBOX_PATH, send_interval=OUTBOX_SEND_INTERVAL, max_entries=OUTBOX_MAX_ENTRIES,
+                upload_timeout=OUTBOX_UPLOAD_TIMEOUT, max_attempts=OUTBOX_UPLOAD_ATTEMPTS)
+memory_profiler.register_cache("alert_history", alert_engine.compact_history)
+fleet = None
+if FLEET_PORT or FLEET_NODES:
+    fleet = FleetRegistry(
+        require_env("FLEET_TOKEN"),
+        nodes=parse_nodes(FLEET_NODES or ""),
+        stale_after=FLEET_STALE_AFTER,
+        on_sample=lambda host, sample: alert_engine.add_sample(sample, host=host),
+    )
+# In fleet mode local alerts are tagged with this Pi's name too
+LOCAL_ALERT_HOST = FLEET_NAME if fleet else None
+machine_registry = MachineRegistry(MACHINES_PATH, BOOT_HISTORY_PATH, default={
+    "name": "pc",
+    "mac": PC_MAC,
+    "ip": PC_IP,
+    "ssh_user": SSH_USER,
+    "ssh_key": SSH_KEY,
+    "broadcast": [a.strip() for a in getenv("PC_BROADCAST", "255.255.255.255").split(",") if a.strip()],
+})
+smart_sampler = SmartSampler(
+    SMART_CACHE_PATH, devices=parse_devices(SMART_DEVICES) if SMART_DEVICES else None, temp_warn=SMART_TEMP_WARN
+)
 
 dp = Dispatcher()
+if RECORD_UPDATES_PATH:
+    dp.update.outer_middleware(UpdateRecorder(RECORD_UPDATES_PATH))
+
+metrics = Metrics()
+metrics.gauge("pi_cpu_temperature_celsius", "SoC temperature", unit="celsius")
+metrics.gauge("pi_cpu_load_percent", "CPU load per core")
+metrics.gauge("pi_memory_used_bytes", "RAM in use", unit="bytes")
+metrics.gauge("pi_memory_total_bytes", "Total RAM", unit="bytes")
+metrics.gauge("pi_disk_used_bytes", "Root filesystem usage", unit="bytes")
+metrics.gauge("pi_disk_total_bytes", "Root filesystem size", unit="bytes")
+metrics.gauge("pi_wifi_connected", "1 if wlan0 has an IPv4 address")
+metrics.gauge("pi_disk_temperature_celsius", "SMART disk temperature", unit="celsius")
+metrics.gauge("pi_disk_standby", "1 if the disk was spun down at the last SMART poll")
+metrics.gauge("pi_disk_smart_passed", "SMART overall health self-assessment")
+metrics.gauge("pi_disk_power_on_hours", "SMART power-on hours")
+metrics.gauge("pi_disk_error_count", "SMART reallocated/pending/uncorrectable sectors or NVMe media errors")
+metrics.gauge("pi_throttled_flags", "Raw get_throttled bitmask from the firmware")
+metrics.gauge("pc_online", "1 if the PC accepts SSH connections")
+metrics.gauge("bot_rss_bytes", "Resident memory of the bot process", unit="bytes")
+metrics.gauge("bot_outbox_pending", "Messages waiting in the outbox for Telegram to be reachable")
+metrics.gauge("pi_telemetry_timestamp_seconds", "Time of the last telemetry refresh", unit="seconds")
+metrics.counter("bot_handler_calls", "Handled updates per command")
+metrics.histogram("bot_handler_latency_seconds", "Handler execution time per command", unit="seconds")
+metrics.counter("bot_unauthorized_messages", "Messages rejected by only_owner")
+metrics.counter("bot_download_bytes", "Bytes of downloaded media sent to Telegram", unit="bytes")
+metrics.histogram("bot_sd_job_duration_seconds", "Stable Diffusion txt2img request time", unit="seconds")
+
+
+def record_handler_sample(command, seconds):
+    metrics.inc("bot_handler_calls", command=command)
+    metrics.observe("bot_handler_latency_seconds", seconds, command=command)
+
+
+handler_stats = HandlerStats()
+loop_monitor = LoopLagMonitor(interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD_MS / 1000)
+handler_timer = HandlerTimer(handler_stats, on_sample=record_handler_sample)
+dp.message.middleware(handler_timer)
+dp.callback_query.middleware(handler_timer)
 
 
 # ---- WebUI remote control helpers ----
@@ -80,7 +250,7 @@ def ssh_run_script(script_name, timeout=30):
     return rc, out, err
 
 def call_remote_sdapi(prompt, width=512, height=512, steps=20, cfg=7.0, model=None, lora_prefix=None, timeout=120):
-    sd_url = f"http://{PC_IP}:7860/sdapi/v1/txt2img"
+    sd_url = f"{SD_API_BASE}/sdapi/v1/txt2img"
     final_prompt = f"{(lora_prefix + ' ') if lora_prefix else ''}{prompt}"
     payload = {
         "prompt": final_prompt,
@@ -103,9 +273,6 @@ def call_remote_sdapi(prompt, width=512, height=512, steps=20, cfg=7.0, model=No
 
 #----------Addons-------------
 
-def wake_pc():
-    send_magic_packet(PC_MAC)
-
 def get_uptime():
     return time.time() - psutil.boot_time()
 
@@ -168,87 +335,165 @@ def only_owner(handler):
     @wraps(handler)
     async def wrapper(message: Message, *args, **kwargs):
         if message.from_user.id != MY_ID:
-            with open(LOG_FILE_PATH, "a") as f:
-                f.write(f"[{datetime.now()}] Unauthorized access by ID {message.from_user.id}, "
-                        f"username: @{message.from_user.username}, text: {message.text}\n")
+            metrics.inc("bot_unauthorized_messages")
+            access_log.record(
+                "unauthorized",
+                user_id=message.from_user.id,
+                username=message.from_user.username,
+                text=message.data if isinstance(message, CallbackQuery) else message.text,
+            )
             await message.answer("Access denied 🙅‍♂️")
             return
         return await handler(message, *args, **kwargs)
     return wrapper
 
-def get_disk_temperature(dev="/dev/sda"):
-    try:
-        result = subprocess.getoutput(f"smartctl -A -d sat {dev}")
-        for line in result.splitlines():
-            if "Temperature_Celsius" in line:
-                match = re.search(r"-\s+(\d+)", line)
-                if match:
-                    return f"{match.group(1)} °C"
-                return line.strip()
-        return "Temperature not found"
-    except Exception as e:
-        return f"Error: {e}"
-
-def is_pc_online(ip=PC_IP):
+def is_pc_online(ip=PC_IP, port=22):
     try:
-        socket.setdefaulttimeout(1)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((ip, 22))
+        socket.create_connection((ip, port), timeout=1).close()
         return True
-    except:
+    except OSError:
         return False
 
+def collect_pi_telemetry():
+    try:
+        metrics.set("pi_cpu_temperature_celsius", get_cpu_temperature())
+    except Exception:
+        metrics.set("pi_cpu_temperature_celsius", None)
+    for core, load in enumerate(psutil.cpu_percent(percpu=True)):
+        metrics.set("pi_cpu_load_percent", load, core=core)
+    ram = psutil.virtual_memory()
+    metrics.set("pi_memory_used_bytes", ram.used)
+    metrics.set("pi_memory_total_bytes", ram.total)
+    disk = psutil.disk_usage('/')
+    metrics.set("pi_disk_used_bytes", disk.used)
+    metrics.set("pi_disk_total_bytes", disk.total)
+    metrics.set("pi_wifi_connected", 1 if is_wifi_connected() else 0)
+    for machine in machine_registry.machines.values():
+        metrics.set("pc_online", 1 if is_pc_online(machine.ip, machine.ssh_port) else 0, machine=machine.name)
+    metrics.set("bot_outbox_pending", len(outbox))
+    metrics.set("pi_telemetry_timestamp_seconds", time.time())
+
+def publish_smart_metrics():
+    for name, disk in smart_sampler.disks.items():
+        fresh = not disk.get("standby") and not disk.get("error")
+        metrics.set("pi_disk_temperature_celsius", disk.get("temperature") if fresh else None, device=name)
+        metrics.set("pi_disk_standby", 1 if disk.get("standby") else 0, device=name)
+        if disk.get("passed") is not None:
+            metrics.set("pi_disk_smart_passed", 1 if disk["passed"] else 0, device=name)
+        if disk.get("power_on_hours") is not None:
+            metrics.set("pi_disk_power_on_hours", disk["power_on_hours"], device=name)
+        for counter, value in disk.get("counters", {}).items():
+            metrics.set("pi_disk_error_count", value, device=name, counter=counter)
+
+def get_throttled():
+    try:
+        with open(THROTTLED_SYSFS_PATH) as f:
+            return int(f.read().strip(), 16)
+    except (OSError, ValueError):
+        pass
+    if not VCGENCMD:
+        return None
+    match = re.search(r"throttled=(0x[0-9a-fA-F]+)", subprocess.getoutput(f"{VCGENCMD} get_throttled"))
+    return int(match.group(1), 16) if match else None
+
+def read_alert_sample():
+    sample = {"ts": time.time(), "wifi": 1 if is_wifi_connected() else 0}
+    try:
+        sample["cpu_temp"] = get_cpu_temperature()
+    except (OSError, ValueError):
+        pass
+    throttled = get_throttled()
+    if throttled is not None:
+        sample.update(decode_throttled(throttled))
+        metrics.set("pi_throttled_flags", throttled)
+    disks = [d for d in smart_sampler.disks.values() if d.get("sampled_at")]
+    temps = [d["temperature"] for d in disks if d.get("temperature") is not None and not d.get("standby")]
+    if temps:
+        sample["disk_temp_max"] = max(temps)
+    if disks:
+        sample["disk_errors"] = sum(sum(d.get("counters", {}).values()) for d in disks)
+        # The sampler keeps the counter history, so the alert engine doesn't need a day of samples
+        sample["disk_errors_grew"] = int(any(smart_sampler.errors_grew(name, now=sample["ts"])
+                                             for name, d in smart_sampler.disks.items() if d.get("sampled_at")))
+    return sample
+
 #---------/Addons-------------
 
-async def temperature_watcher(bot: Bot, threshold: float, chat_id: int):
-    notified = False
-    while True:
-        temp = get_cpu_temperature()
-        if temp > threshold and not notified:
-            await bot.send_message(chat_id, f"🔥 Warning! Temperature {temp}°C exceeded threshold {threshold}°C.")
-            notified = True
-        elif temp <= threshold and notified:
-            notified = False
-        await asyncio.sleep(60)
-
-async def wifi_status(bot: Bot, chat_id: int):
-    notified = False
-    await asyncio.sleep(10)
-    while True:
-        connected = is_wifi_connected()
-        if not connected and not notified:
-            await bot.send_message(chat_id, f"🛜 Warning! Wi-Fi disconnected.")
-            notified = True
-        elif connected and notified:
-            notified = False
-        await asyncio.sleep(120)
-
-async def log_cleaner():
-    while True:
-        now = datetime.now()
-        next_clean = now.replace(minute=0, second=0, microsecond=0)
-        if now.hour < 12:
-            next_clean = next_clean.replace(hour=12)
-        else:
-            next_clean = next_clean.replace(day=now.day + 1, hour=0)
-        wait_seconds = (next_clean - now).total_seconds()
-        await asyncio.sleep(wait_seconds)
-        with open(LOG_FILE_PATH, "w") as f:
-            f.write(f"[{datetime.now()}] Log file auto-cleared.\n")
+# ---- Scheduled jobs (registered in main()) ----
+
+async def sample_telemetry():
+    sample = await asyncio.to_thread(read_alert_sample)
+    alert_engine.add_sample(sample, host=LOCAL_ALERT_HOST)
+    if sample["wifi"] and outbox.last_error and len(outbox):
+        # Connectivity is back: don't wait for the retry backoff
+        scheduler.trigger("outbox_flush")
 
-async def morning_trigger_listener(bot: Bot):
+async def evaluate_alerts(bot: Bot):
+    for key, text in alert_engine.evaluate():
+        await outbox.send(bot, MY_ID, text, key=key)
+
+async def poll_fleet():
+    await fleet.poll()
+    fleet.check_stale()
+
+async def poll_smart():
+    await smart_sampler.poll()
+    publish_smart_metrics()
+
+async def sample_memory():
+    rss = await asyncio.to_thread(memory_profiler.sample)
+    metrics.set("bot_rss_bytes", rss)
+    memory_profiler.evict_if_over(rss)
+
+async def rotate_access_log():
+    archive = await access_log.rotate()
+    if archive:
+        print(f"[log-rotate] Rotated into {archive}")
+
+async def poll_wake_trigger(bot: Bot):
     url = f"{WAKE_TRIGGER_BASE}?key={SECRET_KEY}"
-    while True:
-        try:
-            res = requests.get(url, timeout=5)
-            if res.status_code == 200 and res.json().get("wake"):
-                if is_morning():
-                    print("📲 Wake-up received in the morning — sending info.")
-                    await send_morning_info(bot)
-                else:
-                    print("🌙 Wake-up received outside morning — ignored.")
-        except Exception as e:
-            print(f"[wake-trigger] Error: {e}")
-        await asyncio.sleep(3)
+    try:
+        res = await asyncio.to_thread(requests.get, url, timeout=5)
+        wake = res.status_code == 200 and res.json().get("wake")
+    except (requests.RequestException, ValueError) as e:
+        print(f"[wake-trigger] Error: {e}")
+        return
+    if wake:
+        if is_morning():
+            print("📲 Wake-up received in the morning — sending info.")
+            await send_morning_info(bot)
+        else:
+            print("🌙 Wake-up received outside morning — ignored.")
+
+def schedule_background_jobs(bot: Bot):
+    scheduler.every("telemetry_sample", ALERT_SAMPLE_INTERVAL, sample_telemetry)
+    scheduler.every("alerts", ALERT_EVAL_INTERVAL, partial(evaluate_alerts, bot))
+    # Polls start a little after their aligned slot, so they don't pile onto the same tick as the other jobs
+    # and several Pis polling one server don't hit it at the same instant
+    def network_jitter(interval):
+        return min(SCHEDULER_JITTER, interval / 4)
+
+    scheduler.every("wake_trigger", WAKE_TRIGGER_INTERVAL, partial(poll_wake_trigger, bot),
+                    jitter=network_jitter(WAKE_TRIGGER_INTERVAL))
+    scheduler.on_demand("access_log_flush", access_log.flush)
+    scheduler.on_demand("outbox_flush", partial(outbox.flush, bot))
+    outbox.on_pending = lambda delay: scheduler.trigger("outbox_flush", delay)
+    if len(outbox):
+        scheduler.trigger("outbox_flush")
+    access_log.on_record = lambda full: scheduler.trigger(
+        "access_log_flush", 0 if full else access_log.flush_interval
+    )
+    if LOG_ROTATE_HOURS:
+        hours = ",".join(str(h) for h in sorted(set(LOG_ROTATE_HOURS)))
+        scheduler.cron("log_rotate", f"0 {hours} * * *", rotate_access_log)
+    if METRICS_PORT:
+        scheduler.every("metrics", METRICS_INTERVAL, partial(asyncio.to_thread, collect_pi_telemetry), first_delay=0)
+    scheduler.every("smart", SMART_INTERVAL, poll_smart, jitter=network_jitter(SMART_INTERVAL), first_delay=0)
+    if MEM_SOFT_LIMIT_MB:
+        scheduler.every("memory", MEM_SAMPLE_INTERVAL, sample_memory)
+    if fleet:
+        scheduler.every("fleet_poll", FLEET_POLL_INTERVAL, poll_fleet, jitter=network_jitter(FLEET_POLL_INTERVAL),
+                        first_delay=0)
 
 async def send_morning_info(bot: Bot):
     now = datetime.now()
@@ -257,10 +502,11 @@ async def send_morning_info(bot: Bot):
     msg = f"👋 Good morning!\n📅 Today is {weekday_en}, {date_str}\n\n"
 
 
-    if is_pc_online():
-        msg += "🖥️ PC: online ✅\n"
-    else:
-        msg += "🖥️ PC: offline ❌\n"
+    machines = list(machine_registry.machines.values())
+    online = await asyncio.gather(*(machine_registry.is_online(m) for m in machines))
+    for machine, up in zip(machines, online):
+        label = "PC" if len(machines) == 1 else machine.name
+        msg += f"🖥️ {label}: online ✅\n" if up else f"🖥️ {label}: offline ❌\n"
 
     cpu = psutil.cpu_percent()
     ram = psutil.virtual_memory().percent
@@ -268,7 +514,7 @@ async def send_morning_info(bot: Bot):
 
     try:
         current = requests.get(
-            f"https://api.openweathermap.org/data/2.5/weather?id={CITY_ID}"
+            f"{OPENWEATHER_BASE}/data/2.5/weather?id={CITY_ID}"
             f"&appid={OPENWEATHER_KEY}&units=metric&lang=en"
         ).json()
         obs_time = datetime.utcfromtimestamp(current['dt']).strftime('%H:%M')
@@ -280,7 +526,7 @@ async def send_morning_info(bot: Bot):
 
     try:
         forecast = requests.get(
-            f"https://api.openweathermap.org/data/2.5/forecast?id={CITY_ID}"
+            f"{OPENWEATHER_BASE}/data/2.5/forecast?id={CITY_ID}"
             f"&appid={OPENWEATHER_KEY}&units=metric&lang=en"
         ).json()
 
@@ -302,118 +548,149 @@ async def send_morning_info(bot: Bot):
         msg += "📆 Forecast: N/A\n"
 
     try:
-        res = requests.get("https://open.er-api.com/v6/latest/EUR", timeout=5).json()
+        res = requests.get(f"{CURRENCY_API_BASE}/v6/latest/EUR", timeout=5).json()
         czk = res["rates"]["CZK"]
         rub = res["rates"]["RUB"]
         msg += f"💱 EUR: {czk:.2f} Kč | {rub:.2f} ₽"
     except:
         msg += "💱 Currency: N/A"
 
-    await bot.send_message(chat_id=MY_ID, text=msg)
+    await outbox.send(bot, MY_ID, msg, key="morning_info")
+
+WINDOWS_STATS_CMD = [
+    "powershell -Command \"Get-CimInstance Win32_Processor | Select-Object -ExpandProperty LoadPercentage; "
+    "Get-CimInstance Win32_OperatingSystem | ForEach-Object { $_.TotalVisibleMemorySize, $_.FreePhysicalMemory }; "
+    "(Get-Counter '\\GPU Engine(*)\\Utilization Percentage').CounterSamples | "
+    "Select-Object -First 1 -ExpandProperty CookedValue\""
+]
+
+async def resolve_machines(message: Message, command: str):
+    target = message.text.replace(command, "", 1).strip()
+    try:
+        return machine_registry.resolve(target)
+    except KeyError:
+        groups = ", ".join(machine_registry.groups()) or "none"
+        await message.answer(
+            f"❗ Unknown machine or group: {target}\nMachines: {', '.join(machine_registry.machines)}; groups: {groups}"
+        )
+        return None
+
+class PowerProgress:
+    """One reply edited with a line per machine as a group operation progresses"""
+
+    def __init__(self, message: Message, title: str, machines):
+        self.message = message
+        self.title = title
+        self.lines = {m.name: "⏳ …" for m in machines}
+        self.status = None
+
+    async def update(self, name=None, line=None):
+        if name:
+            self.lines[name] = line
+        text = f"{self.title}\n" + "\n".join(f"<b>{html.escape(n)}</b>: {l}" for n, l in self.lines.items())
+        try:
+            if self.status is None:
+                self.status = await self.message.answer(text, parse_mode="HTML")
+            else:
+                await self.status.edit_text(text, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+
+async def pc_usage_text(machine):
+    rc, out, err = await machine_registry.ssh(machine, WINDOWS_STATS_CMD)
+    if rc != 0:
+        return f"⚠️ stats unavailable: {html.escape(err[:200])}"
+    usage_lines = out.splitlines()
+    try:
+        cpu = usage_lines[0]
+        total_mem, free_mem = map(int, usage_lines[1:3])
+    except (IndexError, ValueError):
+        return "⚠️ unexpected stats output"
+    gpu = usage_lines[3] if len(usage_lines) > 3 else "N/A"
+    return f"CPU {cpu}% · RAM {(total_mem - free_mem) / total_mem * 100:.1f}% · GPU {gpu}%"
 
 @dp.message(Command("start_pc"))
 @only_owner
 async def start_pc_handler(message: Message):
-    try:
-        wake_pc()
-        await message.answer("🚀 Shutdown command sent, awaiting feedback.....")
-        start_time = time.time()
-
-        for _ in range(60):
-            if is_pc_online():
-                duration = round(time.time() - start_time, 2)
-                await message.answer(f"✅ PC turned on in {duration} sec.")
-                break
-            await asyncio.sleep(1)
-        else:
-            await message.answer("❌ The PC did not respond within 60 seconds.")
-            return
-
-        result = subprocess.run(
-            [
-                "ssh", "-i", SSH_KEY,
-                SSH_TARGET,
-                "powershell -Command \"Get-CimInstance Win32_Processor | Select-Object -ExpandProperty LoadPercentage; "
-                "Get-CimInstance Win32_OperatingSystem | ForEach-Object { $_.TotalVisibleMemorySize, $_.FreePhysicalMemory }; "
-                "(Get-Counter '\\GPU Engine(*)\\Utilization Percentage').CounterSamples | "
-                "Select-Object -First 1 -ExpandProperty CookedValue\""
-            ],
-            capture_output=True, text=True
-        )
+    machines = await resolve_machines(message, "/start_pc")
+    if not machines:
+        return
+    progress = PowerProgress(message, "🚀 Waking up:", machines)
+    await progress.update()
 
-        if result.returncode == 0:
-            usage_lines = result.stdout.strip().splitlines()
-            cpu = usage_lines[0]
-            total_mem, free_mem = map(int, usage_lines[1:3])
-            mem_used = (total_mem - free_mem) / total_mem * 100
-            gpu = usage_lines[3] if len(usage_lines) > 3 else "N/A"
-
-            await message.answer(
-                f"📊 PC status:\n"
-                f"• CPU: {cpu}%\n"
-                f"• RAM: {mem_used:.1f}%\n"
-                f"• GPU: {gpu}%"
-            )
-        else:
-            await message.answer(f"⚠️ Error while receiving a download:\n<code>{result.stderr}</code>", parse_mode="HTML")
+    async def wake_one(machine):
+        try:
+            if await machine_registry.is_online(machine):
+                await progress.update(machine.name, "✅ already online")
+                return
+            expected = machine_registry.expected_boot(machine)
+            eta = f" (usually ready in ~{expected:.0f}s)" if expected else ""
+            await progress.update(machine.name, f"⏳ magic packets sent{eta}")
+            seconds = await machine_registry.wake(machine, timeout=max(120, (expected or 0) * 2))
+            if seconds is None:
+                await progress.update(machine.name, "❌ did not respond")
+                return
+            line = f"✅ up in {seconds:.1f}s"
+            if machine.os == "windows":
+                line += f"\n   📊 {await pc_usage_text(machine)}"
+            await progress.update(machine.name, line)
+        except OSError as e:
+            # e.g. a bad broadcast address in machines.json or no network
+            await progress.update(machine.name, f"❌ {html.escape(str(e))}")
 
-    except Exception as e:
-        await message.answer(f"❌ Error:\n<code>{e}</code>", parse_mode="HTML")
+    await asyncio.gather(*(wake_one(m) for m in machines))
 
 @dp.message(Command("shutdown_pc"))
 @only_owner
 async def shutdown_pc_handler(message: Message):
-    try:
-        result = subprocess.run(
-            [
-                "ssh",
-                "-i", SSH_KEY,
-                SSH_TARGET,
-                "shutdown", "/s", "/t", "0"
-            ],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            await message.answer(f"❌ Shutdown Error:\n<code>{result.stderr}</code>", parse_mode="HTML")
-            return
+    machines = await resolve_machines(message, "/shutdown_pc")
+    if not machines:
+        return
+    progress = PowerProgress(message, "🔌 Shutting down:", machines)
+    await progress.update()
 
-        await message.answer("🔌 Shutdown command sent. Awaiting confirmation...")
+    async def shutdown_one(machine):
+        try:
+            if not await machine_registry.is_online(machine):
+                await progress.update(machine.name, "💤 already offline")
+                return
+            ok, detail = await machine_registry.shutdown(machine)
+            await progress.update(machine.name, ("✅ " if ok else "❌ ") + html.escape(detail))
+        except OSError as e:
+            # e.g. no ssh client or no network
+            await progress.update(machine.name, f"❌ {html.escape(str(e))}")
 
-        for _ in range(60):
-            if not is_pc_online():
-                await message.answer("✅ The PC is successfully shut down.")
-                break
-            await asyncio.sleep(1)
-        else:
-            await message.answer("⚠️ The PC did not shut down within 60 seconds.")
-    except Exception as e:
-        await message.answer(f"❌ Error:\n<code>{str(e)}</code>", parse_mode="HTML")
+    await asyncio.gather(*(shutdown_one(m) for m in machines))
 
 @dp.message(Command("lock_pc"))
 @only_owner
 async def lock_pc_handler(message: Message):
-    try:
-        result = subprocess.run(
-            [
-                "ssh", "-i", SSH_KEY,
-                SSH_TARGET,
-                "schtasks", "/run", "/tn", "LockNow"
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="cp1251"
-        )
-        if result.returncode == 0:
-            await message.answer("🔒  PC locked (session disconnected).")
-        else:
-            await message.answer(
-                f"❌  Unable to lock (tsdiscon error):\n<code>{result.stderr}</code>",
-                parse_mode="HTML"
+    machines = await resolve_machines(message, "/lock_pc")
+    if not machines:
+        return
+    results = await asyncio.gather(*(machine_registry.lock(m) for m in machines))
+    lines = [
+        f"{'🔒' if ok else '❌'} <b>{html.escape(m.name)}</b>: {html.escape(detail)}"
+        for m, (ok, detail) in zip(machines, results)
+    ]
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+@dp.message(Command("pcs"))
+@only_owner
+async def pcs_handler(message: Message):
+    machines = list(machine_registry.machines.values())
+    online = await asyncio.gather(*(machine_registry.is_online(m) for m in machines))
+    lines = ["<b>🖥 Machines</b>"]
+    for machine, up in zip(machines, online):
+        groups = f" [{', '.join(machine.groups)}]" if machine.groups else ""
+        lines.append(f"{'🟢' if up else '⚫'} <b>{html.escape(machine.name)}</b> {machine.ip}{html.escape(groups)}")
+        stats = machine_registry.boot_stats(machine)
+        if stats:
+            lines.append(
+                f"   boot p50 {stats['p50']:.0f}s · p90 {stats['p90']:.0f}s · max {stats['max']:.0f}s (n={stats['count']})"
             )
-    except Exception as e:
-        await message.answer(f"❌  Execution error:\n<code>{e}</code>", parse_mode="HTML")
+    lines.append("\n/start_pc, /shutdown_pc, /lock_pc [name|group|all]")
+    await message.answer("\n".join(lines), parse_mode="HTML")
 
 @dp.message(Command("start"))
 @only_owner
@@ -433,7 +710,8 @@ async def show_pc_commands(message: Message):
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="/start_pc"), KeyboardButton(text="/shutdown_pc")],
-            [KeyboardButton(text="/lock_pc")],
+            [KeyboardButton(text="/lock_pc"), KeyboardButton(text="/pcs")],
+            [KeyboardButton(text="/pull")],
             [KeyboardButton(text="⬅ Back")]
         ],
         resize_keyboard=True
@@ -504,7 +782,9 @@ async def webui_generate_handler(message: Message):
     LORA_PREFIX = getenv("LORA_PREFIX")
     model_name = getenv("MODEL_NAME")
 
+    started = time.perf_counter()
     ok, resp = call_remote_sdapi(prompt, width=512, height=512, steps=20, cfg=7.0, model=model_name, lora_prefix=LORA_PREFIX, timeout=240)
+    metrics.observe("bot_sd_job_duration_seconds", time.perf_counter() - started, status="ok" if ok else "error")
     if not ok:
         await message.answer(f"❌ Error SD API: {resp}")
         return
@@ -514,31 +794,61 @@ async def webui_generate_handler(message: Message):
         await message.answer("⚠️ SD API send back empty result")
         return
 
-    img_b64 = images[0]
-    img_bytes = base64.b64decode(img_b64)
-    await message.answer_photo(photo=img_bytes, caption=f"Prompt: {prompt}\nModel: {model_name}")
+    img_bytes = base64.b64decode(images[0])
+    # The JSON response (base64 images, echoed parameters) is several times the
+    # PNG size; don't keep it alive for the whole upload.
+    del resp, images
+    await message.answer_photo(photo=BufferedInputFile(img_bytes, filename="webui.png"), caption=f"Prompt: {prompt}\nModel: {model_name}")
 
 # --------------------------------------
 
-downloader = SocialMediaDownloader()
-
-@dp.message(Command("yt"))
-@only_owner
-async def youtube_download_handler(message: Message):
-    url = message.text.replace("/yt", "").strip()
-    if not url:
-        await message.answer("❗ URL video: /yt <url>")
-        return
-    
+downloader = SocialMediaDownloader(preview_ttl=PREVIEW_TTL)
+memory_profiler.register_cache("link_previews", downloader.clear_previews)
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+# Pending quality choices of sent previews: token -> {"url", "platform", "text"}
+download_choices = {}
+download_tokens = itertools.count(1)
+
+def video_caption(platform, info):
+    duration = timedelta(seconds=info['duration'] or 0)
+    if platform == "tiktok":
+        return f"📱 TikTok video\n⏱ Duration: {duration}"
+    return f"📹 {info['title']}\n⏱ Duration: {duration}"
+
+def quality_label(quality):
+    label = f"{quality['height']}p" if quality['height'] else "Best"
+    if quality['size']:
+        label += f" · ~{format_bytes(quality['size'])}"
+        if quality['size'] > TELEGRAM_UPLOAD_LIMIT:
+            label += " ⚠️"
+    return label
+
+def preview_text(preview):
+    lines = [f"🎬 <b>{html.escape(preview['title'])}</b>"]
+    if preview.get('uploader'):
+        lines.append(f"👤 {html.escape(preview['uploader'])}")
+    if preview['duration']:
+        lines.append(f"⏱ Duration: {timedelta(seconds=int(preview['duration']))}")
+    lines.append("📦 " + " | ".join(quality_label(q) for q in preview['qualities']))
+    if any((q['size'] or 0) > TELEGRAM_UPLOAD_LIMIT for q in preview['qualities']):
+        lines.append("⚠️ Telegram rejects bot uploads over 50 MB.")
+    return "\n".join(lines)
+
+async def fetch_and_send_video(message: Message, platform, url, fmt=None):
+    """Download with yt-dlp and send the file to the chat of `message`"""
     try:
-        await message.answer("⏳ Video downloading...")
-        info = await downloader.download_youtube(url)
-        
+        if platform == "tiktok":
+            info = await downloader.download_tiktok(url, fmt)
+        else:
+            info = await downloader.download_youtube(url, fmt)
+
         if info and os.path.exists(info['filename']):
-            await message.answer_video(
-                video=FSInputFile(info['filename']),
-                caption=f"📹 {info['title']}\n⏱ Duration: {timedelta(seconds=info['duration'])}"
-            )
+            if not await outbox.send(
+                message.bot, message.chat.id, kind="video", path=info['filename'],
+                text=video_caption(platform, info)
+            ):
+                await message.answer("📤 Telegram isn't reachable right now, the video is queued and will follow.")
+            metrics.inc("bot_download_bytes", os.path.getsize(info['filename']), source=platform)
         else:
             await message.answer("❌ Failed to load video")
     except Exception as e:
@@ -546,29 +856,71 @@ async def youtube_download_handler(message: Message):
     finally:
         downloader.cleanup_old_files()
 
+async def offer_video(message: Message, platform, command):
+    args = message.text.replace(command, "", 1).split()
+    if not args:
+        await message.answer(f"❗ URL video: {command} <url> [quality, e.g. 720 or best]")
+        return
+    url = args[0]
+    if len(args) > 1:
+        # Quality given up front: skip the preview
+        choice = args[1].lower().rstrip("p")
+        if choice != "best" and not choice.isdigit():
+            await message.answer("❗ Quality must be a height like 720 or best")
+            return
+        await message.answer("⏳ Video downloading...")
+        await fetch_and_send_video(message, platform, url, quality_format(int(choice) if choice.isdigit() else None))
+        return
+
+    status = await message.answer("🔎 Looking up the video...")
+    try:
+        preview = await downloader.preview(url, platform)
+    except Exception as e:
+        await status.edit_text(f"❌ Error: {html.escape(str(e))}", parse_mode="HTML")
+        return
+    token = str(next(download_tokens))
+    text = preview_text(preview)
+    download_choices[token] = {"url": preview['url'], "platform": platform, "text": text}
+    while len(download_choices) > 50:
+        download_choices.pop(next(iter(download_choices)))
+    buttons = [
+        InlineKeyboardButton(text=f"⬇️ {quality_label(q)}", callback_data=f"dl:{token}:{q['height'] or 'best'}")
+        for q in preview['qualities']
+    ]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        *[buttons[i:i + 2] for i in range(0, len(buttons), 2)],
+        [InlineKeyboardButton(text="✖️ Cancel", callback_data=f"dl:{token}:cancel")],
+    ])
+    await status.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+
+@dp.message(Command("yt"))
+@only_owner
+async def youtube_download_handler(message: Message):
+    await offer_video(message, "youtube", "/yt")
+
 @dp.message(Command("tt"))
 @only_owner
 async def tiktok_download_handler(message: Message):
-    url = message.text.replace("/tt", "").strip()
-    if not url:
-        await message.answer("❗ Please enter the video URL: /tt <url>")
+    await offer_video(message, "tiktok", "/tt")
+
+@dp.callback_query(F.data.startswith("dl:"))
+@only_owner
+async def download_choice_handler(query: CallbackQuery):
+    _, token, choice = query.data.split(":", 2)
+    request = download_choices.pop(token, None)
+    if request is None:
+        await query.answer("This preview has expired — send the link again.", show_alert=True)
         return
-    
-    try:
-        await message.answer("⏳ Video downloading...")
-        info = await downloader.download_tiktok(url)
-        
-        if info and os.path.exists(info['filename']):
-            await message.answer_video(
-                video=FSInputFile(info['filename']),
-                caption=f"📱 TikTok video\n⏱ Duration: {timedelta(seconds=info['duration'])}"
-            )
-        else:
-            await message.answer("❌ Failed to load video")
-    except Exception as e:
-        await message.answer(f"❌ Error: {str(e)}")
-    finally:
-        downloader.cleanup_old_files()
+    if choice == "cancel":
+        await query.answer("Cancelled")
+        await query.message.edit_text(f"{request['text']}\n\n✖️ Cancelled", parse_mode="HTML")
+        return
+    height = int(choice) if choice.isdigit() else None
+    await query.answer("Downloading...")
+    await query.message.edit_text(
+        f"{request['text']}\n\n⏳ Downloading {f'{height}p' if height else 'best quality'}...", parse_mode="HTML"
+    )
+    await fetch_and_send_video(query.message, request['platform'], request['url'], quality_format(height))
 
 @dp.message(Command("ig"))
 @only_owner
@@ -588,16 +940,11 @@ async def instagram_download_handler(message: Message):
             
             for media_file in media_files:
                 file_path = os.path.join(info['download_path'], media_file)
-                if media_file.endswith(('.mp4')):
-                    await message.answer_video(
-                        video=FSInputFile(file_path),
-                        caption=f"📱 Instagram {info['type']}\n❤️ Likes: {info.get('likes', 'N/A')}"
-                    )
-                else:
-                    await message.answer_photo(
-                        photo=FSInputFile(file_path),
-                        caption=f"📱 Instagram {info['type']}\n❤️ Likes: {info.get('likes', 'N/A')}"
-                    )
+                await outbox.send(
+                    message.bot, message.chat.id, kind="video" if media_file.endswith('.mp4') else "photo",
+                    path=file_path, text=f"📱 Instagram {info['type']}\n❤️ Likes: {info.get('likes', 'N/A')}"
+                )
+                metrics.inc("bot_download_bytes", os.path.getsize(file_path), source="instagram")
         else:
             await message.answer("❌ Failed")
     except Exception as e:
@@ -610,9 +957,11 @@ async def instagram_download_handler(message: Message):
 async def show_pi_commands(message: Message):
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="/status"), KeyboardButton(text="/disk_temp")],
+            [KeyboardButton(text="/status"), KeyboardButton(text="/disk_temp"), KeyboardButton(text="/disk_health")],
             [KeyboardButton(text="/update_site"), KeyboardButton(text="/commit_force <message>")],
-            [KeyboardButton(text="/exec <command>")],
+            [KeyboardButton(text="/jobs"), KeyboardButton(text="/tasks"), KeyboardButton(text="/alerts")],
+            [KeyboardButton(text="/exec <command>"), KeyboardButton(text="/exec_kill")],
+            [KeyboardButton(text="/perf"), KeyboardButton(text="/mem")],
             [KeyboardButton(text="Downloads")],
             [KeyboardButton(text="⬅ Back")]
         ],
@@ -645,56 +994,107 @@ async def show_logs_menu(message: Message):
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="/show_logs")],
-            [KeyboardButton(text="/clear_logs")],
+            [KeyboardButton(text="/rotate_logs"), KeyboardButton(text="/clear_logs")],
             [KeyboardButton(text="⬅ Back")]
         ],
         resize_keyboard=True
     )
     await message.answer("📋 Logs Menu:", reply_markup=keyboard)
 
+def parse_duration(value):
+    match = re.fullmatch(r"(\d+)([smhd])", value)
+    if not match:
+        return None
+    return int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+def parse_log_time(value):
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return time.time() - seconds
+    return datetime.fromisoformat(value).timestamp()
+
+def parse_log_filters(args):
+    filters = {"limit": 30, "user_id": None, "since": None, "until": None, "text": None}
+    words = []
+    for token in args.split():
+        key, _, value = token.partition(":")
+        if key in ("user", "id") and value.isdigit():
+            filters["user_id"] = int(value)
+        elif key in ("since", "until") and value:
+            filters[key] = parse_log_time(value)
+        elif key == "limit" and value.isdigit():
+            filters["limit"] = max(1, min(int(value), 200))
+        else:
+            words.append(token)
+    if words:
+        filters["text"] = " ".join(words)
+    return filters
+
+def format_log_entry(entry):
+    dt = datetime.fromtimestamp(entry.get("ts") or 0).strftime("%Y-%m-%d %H:%M:%S")
+    if entry.get("event") == "unauthorized":
+        return (
+            f"• <b>{html.escape(str(entry.get('username')))}</b> (ID: <code>{entry.get('user_id')}</code>) — "
+            f"<code>{html.escape(str(entry.get('text')))}</code>\n  🕒 {dt}"
+        )
+    return f"• {html.escape(str(entry.get('text', '')))} 🕒 {dt}"
+
 @dp.message(Command("show_logs"))
 @only_owner
 async def show_logs_handler(message: Message):
+    args = message.text.replace("/show_logs", "", 1).strip()
     try:
-        with open(LOG_FILE_PATH, "r") as f:
-            logs = f.read().strip().splitlines()
-            if not logs:
-                await message.answer("📄 Log file is empty.")
-                return
-
-            def prettify_logs(entries):
-                pretty_lines = []
-                for entry in entries:
-                    match = re.match(
-                        r"\[(.*?)\] Unauthorized access by ID (\d+), username: @(.*?), text: (.*)", entry
-                    )
-                    if match:
-                        dt, uid, username, text = match.groups()
-                        pretty_lines.append(
-                            f"• <b>{username}</b> (ID: <code>{uid}</code>) — <code>{text}</code>\n  🕒 {dt}"
-                        )
-                    else:
-                        pretty_lines.append(f"• {entry}")
-                return "\n\n".join(pretty_lines)
-
-            pretty = prettify_logs(logs)
-            if len(pretty) > 4000:
-                pretty = "... (truncated)\n" + pretty[-4000:]
+        filters = parse_log_filters(args)
+    except ValueError:
+        await message.answer(
+            "❗ Usage: /show_logs [user:&lt;id&gt;] [since:&lt;2h|2024-05-01T10:00&gt;] "
+            "[until:...] [limit:N] [text]",
+            parse_mode="HTML"
+        )
+        return
+    try:
+        entries = await access_log.query(**filters)
+        if not entries:
+            await message.answer("📄 No matching log entries." if args else "📄 Log file is empty.")
+            return
 
-            await message.answer(f"<b>📄 Unauthorized Access Logs:</b>\n\n{pretty}", parse_mode="HTML")
+        pretty_lines = [format_log_entry(entry) for entry in entries]
+        truncated = False
+        while len(pretty_lines) > 1 and sum(len(line) + 2 for line in pretty_lines) > 3800:
+            pretty_lines.pop(0)
+            truncated = True
+        pretty = ("... (older entries omitted)\n\n" if truncated else "") + "\n\n".join(pretty_lines)
+        await message.answer(f"<b>📄 Unauthorized Access Logs:</b>\n\n{pretty}", parse_mode="HTML")
 
     except FileNotFoundError:
         await message.answer("📄 Log file not found.")
     except Exception as e:
-        await message.answer(f"❌ Error:\n<code>{e}</code>", parse_mode="HTML")
+        await message.answer(f"❌ Error:\n<code>{html.escape(str(e))}</code>", parse_mode="HTML")
 
 @dp.message(Command("clear_logs"))
 @only_owner
 async def clear_logs_handler(message: Message):
+    with_archives = message.text.replace("/clear_logs", "", 1).strip() == "all"
     try:
-        with open(LOG_FILE_PATH, "w") as f:
-            f.write(f"[{datetime.now()}] Log file manually cleared.\n")
-        await message.answer("🧹 Log file has been cleared.")
+        await access_log.clear("Log file manually cleared.", archives=with_archives)
+        if with_archives:
+            await message.answer("🧹 Log file and all archives have been cleared.")
+        else:
+            await message.answer("🧹 Log file has been cleared (archives kept, /clear_logs all removes them).")
+    except Exception as e:
+        await message.answer(f"❌ Error:\n<code>{e}</code>", parse_mode="HTML")
+
+@dp.message(Command("rotate_logs"))
+@only_owner
+async def rotate_logs_handler(message: Message):
+    try:
+        archive = await access_log.rotate()
+        stats = access_log.stats()
+        summary = f"{stats['archives']} archives, {format_bytes(stats['archive_bytes'])} compressed"
+        if archive:
+            await message.answer(f"🗜 Rotated into <code>{path.basename(archive)}</code>\n{summary}", parse_mode="HTML")
+        else:
+            await message.answer(f"ℹ️ Nothing to rotate.\n{summary}")
     except Exception as e:
         await message.answer(f"❌ Error:\n<code>{e}</code>", parse_mode="HTML")
 
@@ -703,15 +1103,124 @@ async def clear_logs_handler(message: Message):
 async def back_to_main(message: Message):
     await start_handler(message)
 
+def describe_disk_freshness(disk, now):
+    if disk.get("error"):
+        return f"❗ {html.escape(disk['error'])}"
+    if not disk.get("sampled_at"):
+        return "💤 in standby, never sampled" if disk.get("standby") else "no data yet"
+    age = format_age(now - disk["sampled_at"])
+    return f"💤 standby, reading from {age} ago" if disk.get("standby") else f"{age} ago"
+
 @dp.message(Command("disk_temp"))
 @only_owner
 async def disk_temp_handler(message: Message):
-    temp = get_disk_temperature("/dev/sda")
-    await message.answer(f"🧊 Disk temperature:\n<code>{temp}</code>", parse_mode="HTML")
+    if not smart_sampler.disks:
+        await message.answer("🧊 No disks sampled yet.")
+        return
+    now = time.time()
+    lines = ["🧊 Disk temperature:"]
+    for name, disk in sorted(smart_sampler.disks.items()):
+        temp = disk.get("temperature")
+        temp = "—" if temp is None else f"{temp} °C"
+        warn = " ⚠️" if smart_sampler.warnings(name, now) else ""
+        lines.append(f"<code>{name}</code> {temp}{warn} ({describe_disk_freshness(disk, now)})")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+@dp.message(Command("disk_health"))
+@only_owner
+async def disk_health_handler(message: Message):
+    arg = message.text.replace("/disk_health", "", 1).strip()
+    if arg == "refresh":
+        await poll_smart()
+        arg = ""
+    now = time.time()
+    if arg:
+        disk = smart_sampler.disks.get(arg.replace("/dev/", ""))
+        if not disk:
+            await message.answer(f"❗ Unknown disk: {arg}. Known: {', '.join(smart_sampler.disks) or 'none'}")
+            return
+        rows = [f"{'ID':>3} {'Attribute':<24}{'Val':>4}{'Wst':>4}{'Thr':>4}  Raw"]
+        for attr in disk.get("attributes", []):
+            rows.append(
+                f"{attr['id'] if attr['id'] is not None else '':>3} {attr['name'][:23]:<24}"
+                f"{attr['value'] if attr['value'] is not None else '':>4}"
+                f"{attr['worst'] if attr['worst'] is not None else '':>4}"
+                f"{attr['thresh'] if attr['thresh'] is not None else '':>4}  {attr['raw']}"
+            )
+        text = (
+            f"💽 <b>{html.escape(disk['device'])}</b> {html.escape(str(disk.get('model') or ''))} "
+            f"({describe_disk_freshness(disk, now)})\n<pre>{html.escape(chr(10).join(rows))}</pre>"
+        )
+        await message.answer(text[:4000], parse_mode="HTML")
+        return
+
+    if not smart_sampler.disks:
+        await message.answer("💽 No disks sampled yet. /disk_health refresh polls them now.")
+        return
+    lines = ["<b>💽 Disk health</b>"]
+    for name, disk in sorted(smart_sampler.disks.items()):
+        health = {True: "✅ PASSED", False: "❌ FAILED"}.get(disk.get("passed"), "❔")
+        hours = f", {disk['power_on_hours']} h on" if disk.get("power_on_hours") is not None else ""
+        lines.append(f"\n<b>{name}</b> {html.escape(str(disk.get('model') or ''))} — {health}{hours}")
+        lines.append(f"  {describe_disk_freshness(disk, now)}")
+        counters = ", ".join(f"{k} {v}" for k, v in disk.get("counters", {}).items())
+        if counters:
+            lines.append(f"  {counters}")
+        for warning in smart_sampler.warnings(name, now):
+            lines.append(f"  ⚠️ {html.escape(warning)}")
+    lines.append("\n/disk_health &lt;disk&gt; — attribute table, /disk_health refresh — poll now")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+def format_node_line(name, telemetry, seen_ago=None):
+    parts = []
+    if telemetry.get("cpu_temp") is not None:
+        parts.append(f"🌡 {telemetry['cpu_temp']} °C")
+    if telemetry.get("load"):
+        parts.append(f"load {telemetry['load'][0]}")
+    for key, label in (("memory", "RAM"), ("disk", "disk")):
+        used_total = telemetry.get(key)
+        if used_total and used_total[1]:
+            parts.append(f"{label} {used_total[0] / used_total[1] * 100:.0f}%")
+    if telemetry.get("wifi") == 0:
+        parts.append("🛜 down")
+    if telemetry.get("throttled"):
+        parts.append(f"⚠️ throttled {hex(telemetry['throttled'])}")
+    if telemetry.get("uptime") is not None:
+        parts.append(f"up {format_age(telemetry['uptime'])}")
+    if seen_ago is not None:
+        parts.append(f"{format_age(seen_ago)} ago")
+    return f"<b>{html.escape(name)}</b> " + " · ".join(parts)
+
+async def fleet_status_text():
+    started = time.monotonic()
+    missed = await fleet.poll(budget=FLEET_STATUS_BUDGET)
+    local = expand(await asyncio.to_thread(fleet_agent.collect, FLEET_NAME))
+    now = time.time()
+    lines = [f"📡 <b>Fleet status</b> ({len(fleet.nodes) + 1} nodes)", "🟢 " + format_node_line(FLEET_NAME, local)]
+    for name, node in sorted(fleet.nodes.items()):
+        if node.telemetry is None:
+            reason = "no answer yet" if name in missed else html.escape(node.error or "never reported")
+            lines.append(f"⚫ <b>{html.escape(name)}</b> — {reason}")
+            continue
+        age = now - node.received_at
+        icon = "🔴" if age >= FLEET_STALE_AFTER else "🟡" if name in missed or node.error else "🟢"
+        lines.append(f"{icon} " + format_node_line(name, node.telemetry, seen_ago=age))
+        if name in missed:
+            lines.append(f"   ⏳ no answer within {FLEET_STATUS_BUDGET:g}s, showing the last reading")
+        elif node.error:
+            lines.append(f"   ❗ {html.escape(node.error)}")
+    lines.append(f"\n⏱ {(time.monotonic() - started) * 1000:.0f} ms")
+    return "\n".join(lines)
 
 @dp.message(Command("status"))
 @only_owner
 async def status_handler(message: Message):
+    if message.text.replace("/status", "", 1).strip() == "all":
+        if not fleet:
+            await message.answer("ℹ️ Fleet mode is off. Set FLEET_PORT and/or FLEET_NODES to enable it.")
+            return
+        await message.answer(await fleet_status_text(), parse_mode="HTML")
+        return
     cpu = psutil.cpu_percent(percpu=True)
     cpu_text = " / ".join(f"{c:.1f}%" for c in cpu)
     ram = psutil.virtual_memory()
@@ -735,6 +1244,9 @@ async def status_handler(message: Message):
         f"⏱ Uptime: <code>{uptime_str}</code>\n"
         f"🌐 IP: <code>{ip}</code>"
     )
+    if len(outbox):
+        oldest = time.strftime("%H:%M", time.localtime(outbox.entries[0]["ts"]))
+        text += f"\n📤 Outbox: <code>{len(outbox)} queued since {oldest}</code>"
     await message.answer(text, parse_mode="HTML")
 
 @dp.message(Command("update_site"))
@@ -755,23 +1267,14 @@ async def handle_confirmation(message: Message):
         return
 
     if message.text == "✅ Yes":
-        try:
-            result = subprocess.run(
-                [UPDATE_SCRIPT_PATH],
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout + "\n" + result.stderr
-            if len(output) > 1000:
-                output = output[:1000] + "\n... (output truncated)"
-            if result.returncode == 0:
-                await message.answer(f"✅ Site updated:\n<code>{output}</code>", reply_markup=ReplyKeyboardRemove(), parse_mode="HTML")
-            else:
-                await message.answer(f"❌ Update failed (code {result.returncode}):\n<code>{output}</code>", reply_markup=ReplyKeyboardRemove(), parse_mode="HTML")
-        except Exception as e:
-            await message.answer(f"❌ Unexpected error:\n<code>{str(e)}</code>", reply_markup=ReplyKeyboardRemove(), parse_mode="HTML")
-        finally:
-            del pending_update_confirmation[message.from_user.id]
+        del pending_update_confirmation[message.from_user.id]
+        await start_job(
+            message,
+            kind="update_site",
+            resource="site",
+            title="Site update",
+            steps=[Step("Run update script", [UPDATE_SCRIPT_PATH], timeout=JOB_STEP_TIMEOUT)],
+        )
 
     elif message.text == "❌ No":
         await message.answer("Update cancelled.", reply_markup=ReplyKeyboardRemove())
@@ -784,43 +1287,472 @@ async def commit_force_handler(message: Message):
     if not msg:
         await message.answer("❗ Please provide a commit message: /commit_force <message>")
         return
-    try:
-        status = subprocess.check_output(["git", "status", "--porcelain"]).decode().strip()
-        if not status:
-            await message.answer("ℹ️ Nothing to commit.")
+    await start_job(
+        message,
+        kind="commit_force",
+        resource="git",
+        title="Force-push to rpi-commits",
+        steps=[
+            Step("git status", ["git", "status", "--porcelain"], stop_if_empty=True, empty_message="Nothing to commit."),
+            Step("git add", ["git", "add", "."]),
+            Step("git commit", ["git", "commit", "-m", msg]),
+            Step("git push -f", ["git", "push", "-f", "origin", "rpi-commits"], timeout=JOB_STEP_TIMEOUT),
+        ],
+    )
+
+async def start_job(message: Message, kind, resource, title, steps):
+    status = await message.answer(
+        f"🕒 {html.escape(title)} queued...", reply_markup=ReplyKeyboardRemove(), parse_mode="HTML"
+    )
+    last_text = {"value": None}
+
+    async def show_progress(job):
+        text = describe_job(job, job_registry.expected_duration(job.kind))
+        if text == last_text["value"]:
+            return
+        last_text["value"] = text
+        try:
+            await status.edit_text(text, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+
+    job = job_registry.submit(kind, resource, title, steps, on_progress=show_progress)
+    if job_registry.is_busy(resource):
+        await message.answer(f"🕒 Another {resource} job is running; job #{job.id} will start after it.")
+
+@dp.message(Command("jobs"))
+@only_owner
+async def jobs_handler(message: Message):
+    arg = message.text.replace("/jobs", "", 1).strip()
+    if arg.isdigit():
+        job = job_registry.jobs.get(int(arg))
+        if not job:
+            await message.answer(f"❗ Job #{arg} not found.")
             return
-        subprocess.check_call(["git", "add", "."])
-        subprocess.check_call(["git", "commit", "-m", msg])
-        subprocess.check_call(["git", "push", "-f", "origin", "rpi-commits"])
-        await message.answer("✅ Force-push to <code>rpi-commits</code> completed.", parse_mode="HTML")
-    except subprocess.CalledProcessError as e:
-        await message.answer(f"❌ Commit error:\n<code>{e}</code>", parse_mode="HTML")
+        await message.answer(describe_job(job, job_registry.expected_duration(job.kind)), parse_mode="HTML")
+        return
+
+    jobs = job_registry.recent(10)
+    if not jobs:
+        await message.answer("ℹ️ No jobs yet.")
+        return
+    lines = ["<b>🗂 Recent jobs</b>"]
+    for job in jobs:
+        duration = f", {job.duration:.1f}s" if job.duration is not None else ""
+        lines.append(f"#{job.id} {started_at(job)} {html.escape(job.title)} — {job.status}{duration}")
+    typical = []
+    for kind in sorted(job_registry.durations):
+        values = job_registry.durations[kind]
+        typical.append(f"{kind}: ~{job_registry.expected_duration(kind):.1f}s (max {max(values):.1f}s, n={len(values)})")
+    if typical:
+        lines.append("\n<b>⏱ Typical durations</b>\n" + "\n".join(typical))
+    lines.append("\n/jobs &lt;id&gt; — details")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+def format_span(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds / 3600:.1f}h"
+
+@dp.message(Command("tasks"))
+@only_owner
+async def tasks_handler(message: Message):
+    arg = message.text.replace("/tasks", "", 1).strip()
+    if arg.startswith("run"):
+        name = arg[3:].strip()
+        if name not in scheduler.jobs:
+            await message.answer(f"❗ Unknown task: {name or '(none)'}. Available: {', '.join(scheduler.jobs)}")
+            return
+        scheduler.trigger(name)
+        await message.answer(f"▶️ Task {name} triggered.")
+        return
+
+    now = time.time()
+    lines = [f"<b>⏲ Scheduled tasks</b> ({scheduler.wakeups} timer wake-ups)"]
+    for row in scheduler.snapshot():
+        icon = "⏳" if row["running"] else ("⚠️" if row["last_error"] else "✅" if row["runs"] else "🕒")
+        last = "never"
+        if row["last_run"] is not None:
+            last = f"{format_span(now - row['last_run'])} ago"
+            if row["duration"] is not None:
+                last += f" ({row['duration'] * 1000:.0f} ms)"
+        upcoming = "—"
+        if row["next_run"] is not None:
+            upcoming = "now" if row["next_run"] <= now else f"in {format_span(row['next_run'] - now)}"
+        lines.append(
+            f"{icon} <b>{row['name']}</b> <i>{html.escape(row['schedule'])}</i>\n"
+            f"   last: {last}, next: {upcoming}, runs: {row['runs']}"
+            + (f", failures: {row['failures']}" if row["failures"] else "")
+            + (f", missed: {row['missed']}" if row["missed"] else "")
+        )
+        if row["last_error"]:
+            lines.append(f"   <code>{html.escape(row['last_error'][:200])}</code>")
+    lines.append("\n/tasks run &lt;name&gt; — run a task now")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+ALERTS_USAGE = (
+    "/alerts — rules and their state\n"
+    "/alerts set {json} — add or replace a rule\n"
+    "/alerts del|on|off|unmute &lt;name&gt;\n"
+    "/alerts mute &lt;name&gt; &lt;30m|2h|1d&gt;"
+)
+
+def describe_rule(rule):
+    kind = f"Δ/min over {rule['window']:g}s " if rule["type"] == "rate" else ""
+    text = f"{rule['metric']} {kind}{rule['op']} {rule['value']:g}"
+    if rule["clear"] != rule["value"]:
+        text += f", clear at {rule['clear']:g}"
+    if rule["for"]:
+        text += f", for {rule['for']:g}s"
+    return text
+
+@dp.message(Command("alerts"))
+@only_owner
+async def alerts_handler(message: Message):
+    action, _, rest = message.text.replace("/alerts", "", 1).strip().partition(" ")
+    rest = rest.strip()
+    if action == "set":
+        try:
+            rule = alert_engine.set_rule(json.loads(rest))
+        except ValueError as e:
+            await message.answer(f"❗ Invalid rule: {html.escape(str(e))}\n\n{ALERTS_USAGE}", parse_mode="HTML")
+            return
+        await message.answer(f"✅ Rule <b>{html.escape(rule['name'])}</b> saved: {html.escape(describe_rule(rule))}",
+                             parse_mode="HTML")
+        return
+    if action in ("del", "on", "off", "mute", "unmute"):
+        name, _, duration = rest.partition(" ")
+        if action == "del":
+            found = alert_engine.remove_rule(name)
+        elif action == "mute":
+            seconds = parse_duration(duration.strip())
+            if not seconds:
+                await message.answer(f"❗ Usage:\n{ALERTS_USAGE}", parse_mode="HTML")
+                return
+            found = alert_engine.update_rule(name, muted_until=time.time() + seconds)
+        elif action == "unmute":
+            found = alert_engine.update_rule(name, muted_until=0)
+        else:
+            found = alert_engine.update_rule(name, enabled=action == "on")
+        if not found:
+            await message.answer(f"❗ No rule named {name or '(none)'}.")
+            return
+        await message.answer(f"✅ {action} {name}")
+        return
+    if action:
+        await message.answer(f"❗ Usage:\n{ALERTS_USAGE}", parse_mode="HTML")
+        return
+
+    lines = ["<b>🚨 Alert rules</b>"]
+    for row in alert_engine.status(LOCAL_ALERT_HOST):
+        rule = row["rule"]
+        icon = "🔴" if row["active_hosts"] else "⏸" if not rule["enabled"] else "🔕" if row["muted"] else "🟢"
+        value = "" if row["last_value"] is None else f", now {row['last_value']:g}"
+        if fleet and row["active_hosts"]:
+            value += f", active on {html.escape(', '.join(row['active_hosts']))}"
+        counts = f", fired {row['fired']}×" if row["fired"] else ""
+        if row["suppressed"]:
+            counts += f", {row['suppressed']} deduplicated"
+        lines.append(f"{icon} <b>{html.escape(rule['name'])}</b>: {html.escape(describe_rule(rule))}{value}{counts}")
+    if len(lines) == 1:
+        lines.append("No rules.")
+    lines.append("\n" + ALERTS_USAGE)
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+def split_pull_target(arg):
+    """`nas:/var/log/syslog` -> (nas, path); a Windows drive letter is not mistaken for a machine"""
+    name, sep, rest = arg.partition(":")
+    if sep and name in machine_registry.machines:
+        return machine_registry.machines[name], rest.strip()
+    return machine_registry.default, arg
+
+@dp.message(Command("pull"))
+@only_owner
+async def pull_handler(message: Message):
+    arg = message.text.replace("/pull", "", 1).strip()
+    if not arg:
+        await message.answer(
+            "❗ Usage: /pull [machine:]&lt;remote path&gt;\nExample: /pull C:/Users/me/notes.txt", parse_mode="HTML"
+        )
+        return
+    if asyncssh is None:
+        await message.answer("❗ /pull needs the asyncssh package (pip install asyncssh).")
+        return
+    machine, remote_path = split_pull_target(arg)
+    name = remote_basename(remote_path)
+    status = await message.answer(f"📥 Connecting to {machine.name}…")
+
+    async def show(text):
+        try:
+            await status.edit_text(text, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+
+    label = ""
+    try:
+        async with RemoteFile(machine, remote_path) as remote:
+            if remote.size == 0:
+                await show(f"❗ <code>{html.escape(remote_path)}</code> is empty.")
+                return
+            compress = remote.size >= PULL_COMPRESS_MIN and looks_like_text(name, remote.head)
+            parts = plan_parts(remote.size, PULL_PART_BYTES)
+            started = time.monotonic()
+            uploaded = 0
+            for number, (offset, length) in enumerate(parts, 1):
+                label = f" part {number}/{len(parts)}" if len(parts) > 1 else ""
+
+                async def progress(sent, offset=offset, label=label):
+                    done = offset + sent
+                    speed = done / max(time.monotonic() - started, 0.001)
+                    await show(
+                        f"📥 <code>{html.escape(name)}</code>{label}: {format_bytes(done)} / "
+                        f"{format_bytes(remote.size)} ({format_bytes(speed)}/s)"
+                    )
+
+                filename = name if len(parts) == 1 else f"{name}.part{number:02d}"
+                document = SFTPInputFile(
+                    remote.file, offset, length, filename + (".gz" if compress else ""),
+                    compress=compress, on_progress=progress,
+                )
+                caption = f"📎 {machine.name}:{remote_path}{label}"
+                if number == len(parts) and len(parts) > 1:
+                    caption += (f"\nJoin: cat {name}.part*.gz | gunzip > {name}" if compress
+                                else f"\nJoin: cat {name}.part* > {name}")
+                await message.bot.send_document(
+                    message.chat.id, document, caption=caption, request_timeout=PULL_UPLOAD_TIMEOUT
+                )
+                uploaded += document.sent_bytes
+                await progress(length)
+            elapsed = time.monotonic() - started
+            ratio = f", gzipped to {format_bytes(uploaded)}" if compress else ""
+            await show(
+                f"✅ <code>{html.escape(name)}</code>: {format_bytes(remote.size)} in {elapsed:.1f}s"
+                f" ({len(parts)} part{'s' if len(parts) > 1 else ''}{ratio})"
+            )
+    except (FileNotFoundError, asyncssh.SFTPNoSuchFile):
+        await show(f"❗ Not found: <code>{html.escape(remote_path)}</code>")
+    except IsADirectoryError:
+        await show(f"❗ <code>{html.escape(remote_path)}</code> is a directory.")
+    except (asyncssh.Error, OSError, RuntimeError) as e:
+        await show(f"❌ Transfer failed: <code>{html.escape(str(e))}</code>")
+    except TelegramAPIError as e:
+        await show(f"❌ Upload of <code>{html.escape(name)}</code>{label} failed: <code>{html.escape(str(e))}</code>")
+
+def perf_report():
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "handlers_s": handler_stats.snapshot(),
+        "event_loop": loop_monitor.snapshot(),
+    }
+
+@dp.message(Command("perf"))
+@only_owner
+async def perf_handler(message: Message):
+    arg = message.text.replace("/perf", "", 1).strip()
+    report = perf_report()
+    if arg == "dump":
+        data = json.dumps(report, indent=2, ensure_ascii=False)
+        with open(PERF_DUMP_PATH, "w") as f:
+            f.write(data)
+        await message.answer_document(
+            BufferedInputFile(data.encode(), filename="perf.json"),
+            caption=f"📈 Saved to <code>{PERF_DUMP_PATH}</code>",
+            parse_mode="HTML"
+        )
+        return
+    if arg == "reset":
+        handler_stats.clear()
+        loop_monitor.lags.clear()
+        loop_monitor.events.clear()
+        await message.answer("🧹 Performance counters reset.")
+        return
+
+    lines = ["<b>📈 Handler latency (ms)</b>"]
+    handlers = sorted(report["handlers_s"].items(), key=lambda item: item[1]["p95"], reverse=True)
+    for name, s in handlers[:15]:
+        lines.append(
+            f"<code>{html.escape(name)}</code> ×{s['total']}: p50 {s['p50'] * 1000:.0f} | "
+            f"p95 {s['p95'] * 1000:.0f} | p99 {s['p99'] * 1000:.0f} | max {s['max'] * 1000:.0f}"
+        )
+    if not handlers:
+        lines.append("No samples yet.")
+
+    loop = report["event_loop"]
+    lag = loop["lag_ms"]
+    lines.append(
+        f"\n<b>🔁 Event loop lag (ms)</b>\n"
+        f"p50 {lag['p50']} | p95 {lag['p95']} | p99 {lag['p99']} | max {lag['max']} "
+        f"(threshold {loop['threshold_ms']})"
+    )
+    for event in loop["blocking_events"][-3:]:
+        where = event["stack"][-1].strip().splitlines()[0] if event["stack"] else "?"
+        lines.append(f"⛔ {event['time']} blocked {event['blocked_ms']} ms\n<code>{html.escape(where)}</code>")
+    lines.append("\n/perf dump — full JSON with stacks, /perf reset — clear")
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        text = text[:4000] + "\n..."
+    await message.answer(text, parse_mode="HTML")
+
+@dp.message(Command("mem"))
+@only_owner
+async def mem_handler(message: Message):
+    arg = message.text.replace("/mem", "", 1).strip()
+    if arg == "start":
+        memory_profiler.start()
+        await message.answer("🔬 Allocation tracing started. /mem shows the top sites, a second /mem the growth.")
+        return
+    if arg == "stop":
+        memory_profiler.stop()
+        await message.answer("🔬 Allocation tracing stopped.")
+        return
+    if arg == "evict":
+        event = memory_profiler.evict()
+        dropped = ", ".join(f"{name}: {count}" for name, count in event["dropped"].items()) or "no caches"
+        await message.answer(
+            f"🧹 Dropped {dropped}; gc freed {event['collected']} objects.\n"
+            f"RSS {format_bytes(event['rss_before'])} → {format_bytes(event['rss_after'])}"
+        )
+        return
+
+    rss = memory_profiler.rss()
+    budget = f" / budget {format_bytes(memory_profiler.soft_limit)}" if memory_profiler.soft_limit else ""
+    lines = [f"<b>🧮 Memory</b>\nRSS <code>{format_bytes(rss)}</code> (peak {format_bytes(max(rss, memory_profiler.peak_rss))}{budget})"]
+    if memory_profiler.evictions:
+        last = memory_profiler.evictions[-1]
+        lines.append(
+            f"Last eviction {datetime.fromtimestamp(last['ts']):%H:%M}: "
+            f"{format_bytes(last['rss_before'])} → {format_bytes(last['rss_after'])}"
+        )
+    if not memory_profiler.tracing:
+        lines.append("\nAllocation tracing is off: /mem start (or MEM_TRACE=1 from startup).")
+        await message.answer("\n".join(lines), parse_mode="HTML")
+        return
+
+    report = await asyncio.to_thread(memory_profiler.report)
+    lines.append(f"Traced Python heap <code>{format_bytes(report['traced'])}</code> (peak {format_bytes(report['traced_peak'])})")
+    lines.append("\n<b>By subsystem</b>")
+    for name, size in report["subsystems"][:8]:
+        lines.append(f"<code>{html.escape(name)}</code> {format_bytes(size)}")
+    lines.append("\n<b>Top allocation sites</b>")
+    for site, (size, count) in report["sites"]:
+        lines.append(f"<code>{html.escape(short_site(site))}</code> {format_bytes(size)} ×{count}")
+    if report["growth"] is None:
+        lines.append("\nRun /mem again later to see what grew.")
+    else:
+        lines.append("\n<b>Growth since last /mem</b>")
+        for site, delta in report["growth"] or []:
+            lines.append(f"<code>{html.escape(short_site(site))}</code> {'+' if delta > 0 else '−'}{format_bytes(abs(delta))}")
+        if not report["growth"]:
+            lines.append("Nothing changed.")
+    lines.append("\n/mem evict — drop caches now, /mem stop — stop tracing")
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        text = text[:4000] + "\n..."
+    await message.answer(text, parse_mode="HTML")
+
+def render_exec(proc: StreamedProcess, header: str) -> str:
+    output = proc.tail()
+    if proc.truncated and "\n" in output:
+        output = "...\n" + output.split("\n", 1)[1]
+    output = output.strip() or "[empty output]"
+    return f"{header}\n<code>{html.escape(output)}</code>"
 
 @dp.message(Command("exec"))
 @only_owner
 async def exec_handler(message: Message):
-    cmd = message.text.replace("/exec", "").strip()
+    cmd = message.text.replace("/exec", "", 1).strip()
+    timeout = EXEC_TIMEOUT
+    match = re.match(r"-t\s+(\d+)\s+(.*)", cmd, re.S)
+    if match:
+        timeout, cmd = float(match.group(1)), match.group(2).strip()
     if not cmd:
-        await message.answer("❗ Please provide a command: /exec <command>")
+        await message.answer("❗ Please provide a command: /exec [-t seconds] <command>")
+        return
+
+    print(f"[EXEC] Running: {cmd}", flush=True)
+    status = await message.answer(f"🧪 <b>Running</b> <code>{html.escape(cmd)}</code>...", parse_mode="HTML")
+    proc = StreamedProcess(cmd, tail_bytes=EXEC_TAIL_BYTES)
+    try:
+        await proc.start()
+    except Exception as e:
+        await status.edit_text(f"❌ Execution error:\n<code>{html.escape(str(e))}</code>", parse_mode="HTML")
         return
+    running_execs[status.message_id] = proc
+
+    async def show_progress(p: StreamedProcess):
+        header = f"⏳ <b>Running</b> ({p.elapsed:.0f}s, {format_bytes(p.total_bytes)}) — /exec_kill {status.message_id}"
+        try:
+            await status.edit_text(render_exec(p, header), parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+
     try:
-        print(f"[EXEC] Running: {cmd}", flush=True)
-        output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT).decode()
-        if not output.strip():
-            output = "[empty output]"
-        if len(output) > 4000:
-            output = output[:4000] + "\n... (output truncated)"
-        await message.answer(f"🧪 <b>Result:</b>\n<code>{output.strip()}</code>", parse_mode="HTML")
-    except subprocess.CalledProcessError as e:
-        await message.answer(f"❌ Execution error:\n<code>{e.output.decode()}</code>", parse_mode="HTML")
+        rc = await proc.run(timeout=timeout, on_update=show_progress, interval=EXEC_EDIT_INTERVAL)
+        if proc.timed_out:
+            header = f"⏱ <b>Timed out after {timeout:.0f}s</b>, process killed"
+        elif proc.killed:
+            header = f"🛑 <b>Killed</b> after {proc.elapsed:.1f}s"
+        elif rc == 0:
+            header = f"🧪 <b>Result</b> ({proc.elapsed:.1f}s):"
+        else:
+            header = f"❌ <b>Exit code {rc}</b> ({proc.elapsed:.1f}s):"
+        try:
+            await status.edit_text(render_exec(proc, header), parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+        if proc.truncated:
+            await message.answer_document(
+                FSInputFile(proc.spill_path, filename="exec_output.txt.gz"),
+                caption=f"📎 Full output: {format_bytes(proc.total_bytes)} (gzip)"
+            )
+    finally:
+        running_execs.pop(status.message_id, None)
+        proc.cleanup()
+
+@dp.message(Command("exec_kill"))
+@only_owner
+async def exec_kill_handler(message: Message):
+    arg = message.text.replace("/exec_kill", "", 1).strip()
+    if not running_execs:
+        await message.answer("ℹ️ No running commands.")
+        return
+    targets = [int(arg)] if arg.isdigit() else list(running_execs)
+    killed = []
+    for exec_id in targets:
+        proc = running_execs.get(exec_id)
+        if proc:
+            proc.kill()
+            killed.append(f"<code>{html.escape(str(proc.cmd))}</code>")
+    if killed:
+        await message.answer("🛑 Killed:\n" + "\n".join(killed), parse_mode="HTML")
+    else:
+        await message.answer(f"❗ No running command with id {arg}.")
 
 async def main():
     bot = Bot(token=TOKEN)
-    asyncio.create_task(temperature_watcher(bot, threshold=60.0, chat_id=MY_ID))
-    asyncio.create_task(wifi_status(bot, chat_id=MY_ID))
-    asyncio.create_task(morning_trigger_listener(bot))
-    asyncio.create_task(log_cleaner())
-    await dp.start_polling(bot)
+    schedule_background_jobs(bot)
+    asyncio.create_task(scheduler.run())
+    asyncio.create_task(loop_monitor.run())
+    if METRICS_PORT:
+        await start_metrics_server(metrics, METRICS_HOST, int(METRICS_PORT))
+    if fleet and FLEET_PORT:
+        await start_fleet_server(fleet, FLEET_HOST, int(FLEET_PORT))
+    if BOT_MODE == "webhook":
+        await run_webhook(
+            dp, bot,
+            url=require_env("WEBHOOK_URL"),
+            path=WEBHOOK_PATH,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            secret=require_env("WEBHOOK_SECRET"),
+        )
+    elif BOT_MODE == "polling":
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+    else:
+        raise RuntimeError(f"Unknown BOT_MODE: {BOT_MODE} (expected 'polling' or 'webhook')")
 
 if __name__ == '__main__':
     asyncio.run(main())
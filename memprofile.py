@@ -0,0 +1,203 @@
+import ast
+import ctypes
+import ctypes.util
+import gc
+import os
+import time
+import tracemalloc
+from bisect import bisect_right
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Third-party packages that stand for a subsystem when no module of the bot is on the stack
+LIBRARY_SUBSYSTEMS = {
+    "yt_dlp": "downloads",
+    "instaloader": "downloads",
+    "aiogram": "telegram",
+    "aiohttp": "http",
+    "requests": "http",
+    "urllib3": "http",
+    "asyncssh": "sftp",
+}
+IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>",
+                 "<unknown>")
+
+
+def _load_malloc_trim():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6").malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+
+class MemoryProfiler:
+    """Opt-in memory diagnostics for a small Pi.
+
+    `sample()` records the process RSS and is safe to call from a worker
+    thread. `evict_if_over(rss)` runs the registered eviction callbacks when
+    it exceeds `soft_limit` bytes (at most once per `evict_cooldown`),
+    followed by a garbage collection and `malloc_trim` so freed memory goes
+    back to the OS. The callbacks touch state owned by the event loop, so
+    call it (and `evict()`) from the loop.
+
+    While tracing is on (`start()`), `report()` takes a tracemalloc snapshot
+    and returns the biggest allocation sites, the growth since the previous
+    report, and live memory per subsystem: the innermost module of the bot on
+    the allocating stack (the handler function for `main.py`), or a known
+    library when the bot isn't on the stack.
+    """
+
+    def __init__(self, soft_limit: Optional[int] = None, frames: int = 8, evict_cooldown: float = 300.0,
+                 window: int = 1440):
+        self.soft_limit = soft_limit
+        self.frames = frames
+        self.evict_cooldown = evict_cooldown
+        self.samples: deque = deque(maxlen=window)
+        self.peak_rss = 0
+        self.evictions: deque = deque(maxlen=20)
+        self.caches: Dict[str, Callable[[], int]] = {}
+        self._last_evict = 0.0
+        self._previous: Optional[Dict[Tuple[str, int], Tuple[int, int]]] = None
+        self._functions: Dict[str, Tuple[List[int], List[Tuple[int, str]]]] = {}
+        self._process = psutil.Process()
+        self._malloc_trim = _load_malloc_trim()
+
+    # ---- RSS and eviction ----
+
+    def register_cache(self, name: str, evict: Callable[[], int]):
+        """`evict()` frees what it can and returns how many entries it dropped"""
+        self.caches[name] = evict
+
+    def rss(self) -> int:
+        return self._process.memory_info().rss
+
+    def sample(self) -> int:
+        rss = self.rss()
+        self.samples.append((time.time(), rss))
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def evict_if_over(self, rss: int) -> Optional[dict]:
+        if not self.soft_limit or rss <= self.soft_limit or time.monotonic() - self._last_evict < self.evict_cooldown:
+            return None
+        return self.evict(f"RSS {rss / 1048576:.0f} MB over the {self.soft_limit / 1048576:.0f} MB budget")
+
+    def evict(self, reason: str = "manual") -> dict:
+        self._last_evict = time.monotonic()
+        before = self.rss()
+        dropped = {}
+        for name, evict in self.caches.items():
+            try:
+                dropped[name] = evict()
+            except Exception as e:
+                print(f"[mem] Evicting {name} failed: {e}")
+        collected = gc.collect()
+        if self._malloc_trim is not None:
+            self._malloc_trim(0)
+        after = self.rss()
+        event = {"ts": time.time(), "reason": reason, "dropped": dropped, "collected": collected,
+                 "rss_before": before, "rss_after": after}
+        self.evictions.append(event)
+        print(f"[mem] {reason}: dropped {dropped}, gc {collected} objects, "
+              f"RSS {before / 1048576:.1f} -> {after / 1048576:.1f} MB")
+        return event
+
+    # ---- tracemalloc ----
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def _function_at(self, filename: str, lineno: int) -> Optional[str]:
+        """Innermost function defined around a line of one of the bot's modules"""
+        if filename not in self._functions:
+            spans = []
+            try:
+                with open(filename, encoding="utf-8") as f:
+                    tree = ast.parse(f.read())
+                for node in ast.walk(tree):
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        spans.append((node.lineno, node.end_lineno, node.name))
+            except (OSError, SyntaxError, ValueError):
+                pass
+            spans.sort()
+            self._functions[filename] = ([s[0] for s in spans], [(s[1], s[2]) for s in spans])
+        starts, ends = self._functions[filename]
+        # Nested definitions start later, so the last span that still covers the line is the innermost
+        for i in range(bisect_right(starts, lineno) - 1, -1, -1):
+            end, name = ends[i]
+            if end >= lineno:
+                return name
+        return None
+
+    def subsystem(self, traceback: tracemalloc.Traceback) -> str:
+        library = None
+        for frame in reversed(traceback):  # innermost frame first
+            filename = frame.filename
+            if filename.startswith(ROOT + os.sep) and os.sep + "tools" + os.sep not in filename:
+                module = os.path.splitext(os.path.relpath(filename, ROOT))[0]
+                if module == "main":
+                    return f"main.{self._function_at(filename, frame.lineno) or '<module>'}"
+                return module
+            if library is None:
+                parts = filename.split(os.sep)
+                library = next((LIBRARY_SUBSYSTEMS[p] for p in parts if p in LIBRARY_SUBSYSTEMS), None)
+        return library or "other"
+
+    def report(self, top: int = 10) -> dict:
+        """Top allocation sites, growth since the previous report and per-subsystem totals"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracing is off")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in IGNORED_FILES]
+            # Leave out what the profiler itself allocated (e.g. the parsed modules for attribution)
+            + [tracemalloc.Filter(False, os.path.abspath(__file__), all_frames=True)]
+        )
+        by_site: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        by_subsystem: Dict[str, int] = {}
+        for stat in snapshot.statistics("traceback"):
+            frame = stat.traceback[-1]
+            size, count = by_site.get((frame.filename, frame.lineno), (0, 0))
+            by_site[(frame.filename, frame.lineno)] = (size + stat.size, count + stat.count)
+            name = self.subsystem(stat.traceback)
+            by_subsystem[name] = by_subsystem.get(name, 0) + stat.size
+        del snapshot
+
+        previous, self._previous = self._previous, by_site
+        growth = []
+        if previous is not None:
+            for site in set(by_site) | set(previous):
+                delta = by_site.get(site, (0, 0))[0] - previous.get(site, (0, 0))[0]
+                if delta:
+                    growth.append((site, delta))
+            growth.sort(key=lambda item: item[1], reverse=True)
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced": current,
+            "traced_peak": peak,
+            "sites": sorted(by_site.items(), key=lambda item: item[1][0], reverse=True)[:top],
+            "growth": growth[:top] if previous is not None else None,
+            "subsystems": sorted(by_subsystem.items(), key=lambda item: item[1], reverse=True),
+        }
+
+
+def short_site(site: Tuple[str, int]) -> str:
+    filename, lineno = site
+    if filename.startswith(ROOT + os.sep):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        parts = filename.split(os.sep)
+        filename = os.sep.join(parts[-2:])
+    return f"{filename}:{lineno}"
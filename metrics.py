@@ -0,0 +1,142 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics:
+    """In-process metric registry rendered in the OpenMetrics text format.
+
+    Values are written by handlers and background collectors; a scrape only
+    renders what is already stored, and the rendered text is cached until
+    something changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, str]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, list]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._rendered: Optional[str] = None
+
+    def gauge(self, name: str, help_text: str, unit: str = ""):
+        self._meta[name] = ("gauge", help_text, unit)
+        self._gauges.setdefault(name, {})
+
+    def counter(self, name: str, help_text: str, unit: str = ""):
+        self._meta[name] = ("counter", help_text, unit)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, unit: str = "", buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_text, unit)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = tuple(sorted(buckets))
+
+    def set(self, name: str, value: Optional[float], **labels):
+        with self._lock:
+            series = self._gauges[name]
+            key = _labels(labels)
+            if value is None:
+                series.pop(key, None)
+            else:
+                series[key] = float(value)
+            self._rendered = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self._counters[name]
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + value
+            self._rendered = None
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            buckets = self._buckets[name]
+            series = self._histograms[name]
+            key = _labels(labels)
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * len(buckets), 0, 0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+            self._rendered = None
+
+    def render(self) -> str:
+        with self._lock:
+            if self._rendered is None:
+                self._rendered = self._render()
+            return self._rendered
+
+    def _render(self) -> str:
+        lines = []
+        for name, (kind, help_text, unit) in self._meta.items():
+            lines.append(f"# TYPE {name} {kind}")
+            if unit:
+                lines.append(f"# UNIT {name} {unit}")
+            lines.append(f"# HELP {name} {help_text}")
+            if kind == "gauge":
+                for labels, value in self._gauges[name].items():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif kind == "counter":
+                for labels, value in self._counters[name].items():
+                    lines.append(f"{name}_total{_format_labels(labels)} {_format_value(value)}")
+            else:
+                buckets = self._buckets[name]
+                for labels, (counts, count, total) in self._histograms[name].items():
+                    for bound, bucket_count in zip(buckets, counts):
+                        le = ("le", repr(float(bound)))
+                        lines.append(f"{name}_bucket{_format_labels(labels, le)} {bucket_count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def build_metrics_app(metrics: Metrics) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    return app
+
+
+async def start_metrics_server(metrics: Metrics, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(build_metrics_app(metrics), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[metrics] Serving /metrics on {host}:{port}")
+    return runner
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramAPIError, TelegramEntityTooLarge, TelegramNetworkError, TelegramRetryAfter,
+                                TelegramServerError)
+from aiogram.types import FSInputFile
+
+KINDS = ("message", "video", "photo", "document")
+# Failures that mean "Telegram is unreachable right now", as opposed to a rejected message
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+
+
+def lane(kind: str) -> str:
+    return "text" if kind == "message" else "media"
+
+
+def timed_out(error: Exception) -> bool:
+    """The request got through but did not finish in time (a stalled upload, not an outage)"""
+    return isinstance(error, asyncio.TimeoutError) or (
+        isinstance(error, TelegramNetworkError) and "timeout" in error.message.lower())
+
+
+class Outbox:
+    """Durable queue for messages the bot sends on its own.
+
+    `send()` delivers right away while Telegram is reachable. On a network
+    failure, or while older entries are still waiting, the message is appended
+    to a JSON file instead, so alerts and download results survive Wi-Fi
+    outages and restarts. An entry with a `key` replaces any queued entry with
+    the same key (only the latest temperature alert is worth sending).
+    `flush()` delivers the queue in order, `send_interval` seconds apart, and
+    asks for another attempt through `on_pending(delay)` with a growing delay
+    while the network is still down.
+
+    Text messages and media uploads are queued in separate lanes and text goes
+    first, so a slow upload never holds up an alert. Uploads get
+    `upload_timeout` seconds; one that times out `max_attempts` times, or that
+    Telegram rejects as too large, is dropped and the chat is told so.
+    """
+
+    def __init__(self, path: str, send_interval: float = 1.0, max_entries: int = 200,
+                 retry_delay: float = 5.0, max_retry_delay: float = 120.0, late_after: float = 60.0,
+                 upload_timeout: float = 600.0, max_attempts: int = 5):
+        self.path = path
+        self.send_interval = send_interval
+        self.max_entries = max_entries
+        self.base_retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.late_after = late_after
+        self.upload_timeout = upload_timeout
+        self.max_attempts = max_attempts
+        self.entries: List[dict] = []
+        self.on_pending: Optional[Callable[[float], None]] = None
+        self.retry_delay = retry_delay
+        self.delivered = 0
+        self.compacted = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._next_id = 1
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"[outbox] Failed to load queue: {e}")
+            return
+        self._next_id = max((entry["id"] for entry in self.entries), default=0) + 1
+        if self.entries:
+            print(f"[outbox] {len(self.entries)} queued message(s) from the previous run")
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[outbox] Failed to save queue: {e}")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # ---- queueing ----
+
+    def enqueue(self, chat_id: int, text: str = "", kind: str = "message", path: Optional[str] = None,
+                key: Optional[str] = None, parse_mode: Optional[str] = None) -> dict:
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        if key is not None:
+            before = len(self.entries)
+            self.entries = [entry for entry in self.entries if entry.get("key") != key]
+            self.compacted += before - len(self.entries)
+        entry = {
+            "id": self._next_id, "ts": time.time(), "chat_id": chat_id, "kind": kind,
+            "text": text, "path": path, "key": key, "parse_mode": parse_mode,
+        }
+        self._next_id += 1
+        self.entries.append(entry)
+        if len(self.entries) > self.max_entries:
+            overflow = len(self.entries) - self.max_entries
+            del self.entries[:overflow]
+            self.dropped += overflow
+            print(f"[outbox] Queue full, dropped {overflow} oldest message(s)")
+        self._save()
+        return entry
+
+    async def send(self, bot: Bot, chat_id: int, text: str = "", kind: str = "message", path: Optional[str] = None,
+                   key: Optional[str] = None, parse_mode: Optional[str] = None) -> bool:
+        """Deliver now if possible; returns False when the message was queued instead.
+
+        Raises `TelegramEntityTooLarge` for a file Telegram won't accept.
+        """
+        if any(lane(entry["kind"]) == lane(kind) for entry in self.entries):
+            # Keep the order: this goes behind what is already waiting
+            self.enqueue(chat_id, text, kind=kind, path=path, key=key, parse_mode=parse_mode)
+            if self.last_error is None:
+                self._request_flush(0)
+            return False
+        entry = {"ts": time.time(), "chat_id": chat_id, "kind": kind, "text": text, "path": path,
+                 "parse_mode": parse_mode}
+        try:
+            await self._deliver(bot, entry)
+        except TelegramEntityTooLarge:
+            raise
+        except TelegramRetryAfter as e:
+            self._failed(e, e.retry_after)
+        except TRANSIENT_ERRORS as e:
+            self._failed(e)
+        else:
+            self.delivered += 1
+            return True
+        self.enqueue(chat_id, text, kind=kind, path=path, key=key, parse_mode=parse_mode)
+        self._request_flush(self.retry_delay)
+        return False
+
+    def _failed(self, error: Exception, retry_after: Optional[float] = None):
+        self.last_error = f"{type(error).__name__}: {error}"
+        if retry_after is not None:
+            self.retry_delay = max(float(retry_after), self.base_retry_delay)
+        print(f"[outbox] Telegram unreachable: {self.last_error}")
+
+    def _request_flush(self, delay: float):
+        if self.on_pending:
+            self.on_pending(delay)
+
+    # ---- delivery ----
+
+    async def _deliver(self, bot: Bot, entry: dict):
+        text = entry["text"]
+        if time.time() - entry["ts"] >= self.late_after:
+            stamp = datetime.fromtimestamp(entry["ts"]).strftime("%d.%m %H:%M")
+            text = f"🕓 {stamp} (delayed)\n{text}"
+        chat_id = entry["chat_id"]
+        parse_mode = entry.get("parse_mode")
+        if entry["kind"] == "message":
+            await bot.send_message(chat_id, text, parse_mode=parse_mode)
+            return
+        media = FSInputFile(entry["path"])
+        caption = text or None
+        timeout = self.upload_timeout
+        if entry["kind"] == "video":
+            await bot.send_video(chat_id, media, caption=caption, parse_mode=parse_mode, request_timeout=timeout)
+        elif entry["kind"] == "photo":
+            await bot.send_photo(chat_id, media, caption=caption, parse_mode=parse_mode, request_timeout=timeout)
+        else:
+            await bot.send_document(chat_id, media, caption=caption, parse_mode=parse_mode, request_timeout=timeout)
+
+    async def flush(self, bot: Bot) -> int:
+        """Send queued entries, text before media and in order within each; returns how many were delivered"""
+        sent = 0
+        blocked = set()
+        async with self._lock:
+            while True:
+                entry = next((entry for name in ("text", "media") if name not in blocked
+                              for entry in self.entries if lane(entry["kind"]) == name), None)
+                if entry is None:
+                    break
+                if entry["path"] and not os.path.exists(entry["path"]):
+                    print(f"[outbox] Dropping {entry['kind']} #{entry['id']}: {entry['path']} is gone")
+                    self.dropped += 1
+                    self._pop(entry)
+                    continue
+                try:
+                    await self._deliver(bot, entry)
+                except TelegramEntityTooLarge as e:
+                    self._give_up(entry, e, "too large for Telegram")
+                    continue
+                except TelegramRetryAfter as e:
+                    self._failed(e, e.retry_after)
+                    break
+                except TRANSIENT_ERRORS as e:
+                    self._failed(e)
+                    self.retry_delay = min(self.retry_delay * 2, self.max_retry_delay)
+                    if lane(entry["kind"]) == "text":
+                        break
+                    # Only this upload is stuck (or the network is down, which the text lane finds out)
+                    blocked.add("media")
+                    if timed_out(e):
+                        entry["attempts"] = entry.get("attempts", 0) + 1
+                        if entry["attempts"] >= self.max_attempts:
+                            self._give_up(entry, e, f"timed out {entry['attempts']} times")
+                        else:
+                            self._save()
+                    continue
+                except TelegramAPIError as e:
+                    # Rejected for good (bad markup, blocked, chat gone): retrying won't help
+                    print(f"[outbox] Dropping {entry['kind']} #{entry['id']}: {e}")
+                    self.dropped += 1
+                    self._pop(entry)
+                    continue
+                sent += 1
+                self.delivered += 1
+                self._pop(entry)
+                if self.entries:
+                    await asyncio.sleep(self.send_interval)
+            if not self.entries:
+                self.retry_delay = self.base_retry_delay
+                self.last_error = None
+        if sent:
+            print(f"[outbox] Delivered {sent} queued message(s), {len(self.entries)} left")
+        if self.entries:
+            self._request_flush(self.retry_delay)
+        return sent
+
+    def _give_up(self, entry: dict, error: Exception, reason: str):
+        print(f"[outbox] Dropping {entry['kind']} #{entry['id']}, {reason}: {error}")
+        self.dropped += 1
+        self._pop(entry)
+        name = os.path.basename(entry["path"]) if entry["path"] else entry["kind"]
+        self.enqueue(entry["chat_id"], f"❌ Couldn't send {name}: {reason}")
+
+    def _pop(self, entry: dict):
+        # send() may have compacted the entry away (same key) while it was being delivered
+        self.entries = [queued for queued in self.entries if queued["id"] != entry["id"]]
+        self._save()
+
+    def status(self) -> dict:
+        return {
+            "pending": len(self.entries),
+            "oldest": self.entries[0]["ts"] if self.entries else None,
+            "delivered": self.delivered,
+            "compacted": self.compacted,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
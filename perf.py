@@ -0,0 +1,160 @@
+import asyncio
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+class HandlerStats:
+    """Rolling window of handler durations keyed by command"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self.totals: Dict[str, int] = {}
+
+    def record(self, key: str, seconds: float):
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.window)
+            self.totals[key] = 0
+        self.samples[key].append(seconds)
+        self.totals[key] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for key, values in self.samples.items():
+            result[key] = summarize(values)
+            result[key]["total"] = self.totals[key]
+        return result
+
+    def clear(self):
+        self.samples.clear()
+        self.totals.clear()
+
+
+def event_label(event: TelegramObject, data: Dict[str, Any]) -> str:
+    text = None
+    if isinstance(event, Message):
+        text = event.text
+    elif isinstance(event, CallbackQuery):
+        text = event.data
+    if text and text.startswith("/"):
+        return text.split()[0].split("@")[0]
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    return getattr(callback, "__name__", type(event).__name__)
+
+
+class HandlerTimer(BaseMiddleware):
+    """Inner middleware that times every matched handler"""
+
+    def __init__(self, stats: HandlerStats, on_sample: Optional[Callable[[str, float], None]] = None):
+        self.stats = stats
+        self.on_sample = on_sample
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            label = event_label(event, data)
+            self.stats.record(label, elapsed)
+            if self.on_sample:
+                self.on_sample(label, elapsed)
+
+
+class LoopLagMonitor:
+    """Measure event-loop lag and capture the stack of callbacks that block it.
+
+    A coroutine on the loop refreshes a heartbeat every `interval` seconds and
+    records how late each wake-up was. A watchdog thread notices when the
+    heartbeat goes stale for longer than `threshold` and snapshots the loop
+    thread's stack while it is still blocked.
+    """
+
+    def __init__(self, interval: float = 1.0, threshold: float = 0.25, window: int = 600, max_events: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: deque = deque(maxlen=window)
+        self.events: deque = deque(maxlen=max_events)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._pending: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True).start()
+        while True:
+            expected = loop.time() + self.interval
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lags.append(lag)
+            with self._lock:
+                if self._pending is not None:
+                    self._pending["blocked_ms"] = round(lag * 1000, 1)
+                    self._pending = None
+
+    def _watchdog(self):
+        step = max(self.threshold / 2, 0.01)
+        captured_for = None
+        while True:
+            time.sleep(step)
+            heartbeat = self._heartbeat
+            stale = time.monotonic() - heartbeat - self.interval
+            if stale < self.threshold or captured_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)[-8:]
+            event = {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "blocked_ms": round(stale * 1000, 1),
+                "stack": [line.rstrip() for line in stack],
+            }
+            with self._lock:
+                self.events.append(event)
+                self._pending = event
+            captured_for = heartbeat
+
+    def snapshot(self) -> Dict[str, Any]:
+        lag = summarize(self.lags)
+        return {
+            "lag_ms": {k: (round(v * 1000, 1) if k != "count" else v) for k, v in lag.items()},
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "blocking_events": list(self.events),
+        }
@@ -0,0 +1,127 @@
+import ntpath
+import time
+import zlib
+from typing import AsyncGenerator, Awaitable, Callable, List, Optional, Tuple
+
+from aiogram.types import InputFile
+
+from machines import Machine
+
+try:
+    import asyncssh
+except ImportError:  # optional: only /pull needs it
+    asyncssh = None
+
+TEXT_SUFFIXES = (".txt", ".log", ".csv", ".json", ".xml", ".yaml", ".yml", ".ini", ".cfg", ".md", ".py", ".sql")
+BINARY_MAGIC = (b"\x1f\x8b", b"PK\x03\x04", b"\x89PNG", b"\xff\xd8\xff", b"%PDF")
+
+
+def looks_like_text(name: str, head: bytes) -> bool:
+    if not head:
+        return False
+    if head.startswith(BINARY_MAGIC) or b"\x00" in head:
+        return False
+    if name.lower().endswith(TEXT_SUFFIXES):
+        return True
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is fine
+        return e.start >= len(head) - 3
+    return True
+
+
+def plan_parts(size: int, part_bytes: int) -> List[Tuple[int, int]]:
+    """(offset, length) of every upload part"""
+    return [(offset, min(part_bytes, size - offset)) for offset in range(0, size, part_bytes)] or [(0, 0)]
+
+
+def remote_basename(remote_path: str) -> str:
+    return ntpath.basename(remote_path.rstrip("/\\")) or "file"
+
+
+class SFTPInputFile(InputFile):
+    """Telegram upload that reads a byte range of a remote file as it is sent.
+
+    Nothing is written to local storage: chunks go from the SFTP channel into
+    the multipart request, optionally through a gzip compressor. Concatenated
+    gzip parts decompress as one stream, so a split text file can be joined
+    with `cat part*.gz | gunzip`.
+    """
+
+    def __init__(self, remote, offset: int, length: int, filename: str, compress: bool = False,
+                 on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+                 progress_interval: float = 3.0, chunk_size: int = 256 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.remote = remote
+        self.offset = offset
+        self.length = length
+        self.compress = compress
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.sent_raw = 0
+        self.sent_bytes = 0
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if self.compress else None
+        await self.remote.seek(self.offset)
+        last_report = time.monotonic()
+        while self.sent_raw < self.length:
+            chunk = await self.remote.read(min(self.chunk_size, self.length - self.sent_raw))
+            if not chunk:
+                break
+            self.sent_raw += len(chunk)
+            data = compressor.compress(chunk) if compressor else chunk
+            if data:
+                self.sent_bytes += len(data)
+                yield data
+            if self.on_progress and time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                await self.on_progress(self.sent_raw)
+        if compressor:
+            tail = compressor.flush()
+            self.sent_bytes += len(tail)
+            yield tail
+
+
+class RemoteFile:
+    """`async with RemoteFile(machine, path) as remote:` opens the file over SFTP and stats it"""
+
+    def __init__(self, machine: Machine, path: str, connect_timeout: float = 15.0):
+        self.machine = machine
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.size = 0
+        self.head = b""
+        self.file = None
+        self._conn = None
+        self._sftp = None
+
+    async def __aenter__(self) -> "RemoteFile":
+        if asyncssh is None:
+            raise RuntimeError("asyncssh is not installed (pip install asyncssh)")
+        self._conn = await asyncssh.connect(
+            self.machine.ip, port=self.machine.ssh_port, username=self.machine.ssh_user,
+            client_keys=[self.machine.ssh_key], connect_timeout=self.connect_timeout,
+        )
+        try:
+            self._sftp = await self._conn.start_sftp_client()
+            attrs = await self._sftp.stat(self.path)
+            if attrs.type == asyncssh.FILEXFER_TYPE_DIRECTORY:
+                raise IsADirectoryError(self.path)
+            self.size = attrs.size or 0
+            self.file = await self._sftp.open(self.path, "rb")
+            self.head = await self.file.read(8192)
+        except BaseException:
+            await self.__aexit__(None, None, None)
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.file is not None:
+            await self.file.close()
+        if self._sftp is not None:
+            self._sftp.exit()
+        if self._conn is not None:
+            self._conn.close()
+            await self._conn.wait_closed()
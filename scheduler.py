@@ -0,0 +1,258 @@
+import asyncio
+import math
+import random
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+
+class CronSpec:
+    """Five-field cron expression: minute hour day-of-month month day-of-week"""
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        parsed = [self._parse(field, lo, hi) for field, (lo, hi) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            base, _, step = part.partition("/")
+            if base == "*":
+                start, end = lo, hi
+            elif "-" in base:
+                start, end = (int(x) for x in base.split("-", 1))
+            else:
+                start = end = int(base)
+            if step and base != "*" and "-" not in base:
+                end = hi
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {lo}-{hi}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, ts: float) -> float:
+        dt = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"Cron expression never fires: {self.expr!r}")
+
+
+class ScheduledJob:
+    def __init__(self, name: str, func: Callable[[], Awaitable[None]], interval: Optional[float] = None,
+                 cron: Optional[CronSpec] = None, jitter: float = 0.0, first_delay: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.jitter = jitter
+        self.first_delay = first_delay
+        self.next_run: Optional[float] = None
+        self.fire_at: Optional[float] = None
+        self.triggered: Optional[float] = None
+        self.backoff_until: Optional[float] = None
+        self.running = False
+        self.last_started: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.missed = 0
+
+    @property
+    def schedule(self) -> str:
+        if self.cron:
+            return f"cron {self.cron.expr}"
+        if self.interval:
+            return f"every {self.interval:g}s"
+        return "on demand"
+
+    def due_at(self) -> Optional[float]:
+        candidates = [t for t in (self.fire_at, self.triggered) if t is not None]
+        if not candidates:
+            return None
+        due = min(candidates)
+        if self.backoff_until is not None:
+            due = max(due, self.backoff_until)
+        return due
+
+    def next_slot(self, now: float) -> Optional[float]:
+        if self.cron:
+            return self.cron.next_after(now)
+        if self.interval:
+            # Anchored to wall-clock multiples of the interval: never drifts, and
+            # jobs with commensurate intervals wake up together.
+            return (math.floor(now / self.interval) + 1) * self.interval
+        return None
+
+    def set_next(self, anchor: Optional[float]):
+        self.next_run = anchor
+        self.fire_at = None if anchor is None else anchor + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+
+class Scheduler:
+    """Runs every periodic background task from one loop.
+
+    The loop sleeps until the earliest due job and then starts every job due
+    within `coalesce` seconds, so independent timers share wake-ups. Jobs
+    with jitter are left out of that and start at their own time, or the
+    jitter would be pulled back onto the shared tick. A job
+    that raises is retried with exponential backoff instead of dying, and a
+    job still running when it comes due again is not started twice.
+    """
+
+    def __init__(self, coalesce: float = 1.0, base_backoff: float = 5.0, max_backoff: float = 600.0):
+        self.coalesce = coalesce
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self.wakeups = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks = set()
+        self._started = False
+
+    def every(self, name: str, seconds: float, func, jitter: float = 0.0, first_delay: Optional[float] = None):
+        self._add(ScheduledJob(name, func, interval=seconds, jitter=jitter, first_delay=first_delay))
+
+    def cron(self, name: str, expr: str, func, jitter: float = 0.0):
+        self._add(ScheduledJob(name, func, cron=CronSpec(expr), jitter=jitter))
+
+    def on_demand(self, name: str, func):
+        self._add(ScheduledJob(name, func))
+
+    def _add(self, job: ScheduledJob):
+        self.jobs[job.name] = job
+        if self._started:
+            self._arm(job, time.time())
+            self._notify()
+
+    def remove(self, name: str):
+        self.jobs.pop(name, None)
+
+    def trigger(self, name: str, delay: float = 0.0):
+        """Run a job after `delay` seconds; repeated triggers collapse into the earliest one"""
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        at = time.time() + delay
+        if job.triggered is None or at < job.triggered:
+            job.triggered = at
+            self._notify()
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _arm(self, job: ScheduledJob, now: float):
+        if job.first_delay is not None:
+            job.set_next(now + job.first_delay)
+        else:
+            job.set_next(job.next_slot(now))
+
+    def _start(self, job: ScheduledJob, now: float):
+        horizon = now + self.coalesce
+        if job.fire_at is not None and job.fire_at <= horizon:
+            anchor = job.next_slot(max(now, job.next_run or now))
+            if job.interval and job.next_run is not None:
+                job.missed += max(0, int((now - job.next_run) // job.interval))
+            job.set_next(anchor)
+        if job.triggered is not None and job.triggered <= horizon:
+            job.triggered = None
+        job.running = True
+        task = asyncio.create_task(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: ScheduledJob):
+        job.last_started = time.time()
+        started = time.monotonic()
+        try:
+            await job.func()
+            job.consecutive_failures = 0
+            job.backoff_until = None
+            job.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.consecutive_failures += 1
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (job.consecutive_failures - 1))
+            job.backoff_until = time.time() + delay
+            job.triggered = job.backoff_until
+            job.last_error = f"{type(e).__name__}: {e}"
+            print(f"[scheduler] {job.name} failed ({job.consecutive_failures}x), retry in {delay:.0f}s: {job.last_error}")
+            traceback.print_exc()
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            job.running = False
+            self._notify()
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        self._started = True
+        now = time.time()
+        for job in self.jobs.values():
+            self._arm(job, now)
+        while True:
+            self._wake.clear()
+            now = time.time()
+            for job in list(self.jobs.values()):
+                due = job.due_at()
+                slack = 0.0 if job.jitter else self.coalesce
+                if not job.running and due is not None and due <= now + slack:
+                    self._start(job, now)
+            pending = [job.due_at() for job in self.jobs.values() if not job.running]
+            pending = [due for due in pending if due is not None]
+            timeout = max(0.0, min(pending) - time.time()) if pending else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.wakeups += 1
+
+    def snapshot(self) -> List[dict]:
+        rows = []
+        for job in self.jobs.values():
+            rows.append({
+                "name": job.name,
+                "schedule": job.schedule,
+                "running": job.running,
+                "last_run": job.last_started,
+                "duration": job.last_duration,
+                "next_run": job.due_at(),
+                "runs": job.runs,
+                "failures": job.failures,
+                "missed": job.missed,
+                "last_error": job.last_error,
+            })
+        return rows
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+# ATA attribute ids whose raw value is a count that should never grow
+COUNTERS = {5: "reallocated", 197: "pending", 198: "uncorrectable"}
+SKIP_BLOCK_PREFIXES = ("loop", "ram", "zram", "mmcblk", "dm-", "md", "sr")
+
+
+def discover_disks(sys_block: str = "/sys/block") -> List[Tuple[str, str]]:
+    """(device path, smartctl -d type) for every attached SATA/USB/NVMe disk, without forking"""
+    disks = []
+    try:
+        names = sorted(os.listdir(sys_block))
+    except OSError:
+        return disks
+    for name in names:
+        if name.startswith(SKIP_BLOCK_PREFIXES):
+            continue
+        if name.startswith("nvme"):
+            disks.append((f"/dev/{name}", "nvme"))
+        elif name.startswith(("sd", "hd")):
+            disks.append((f"/dev/{name}", "sat"))
+    return disks
+
+
+def parse_devices(spec: str) -> List[Tuple[str, str]]:
+    """`sda:sat,nvme0n1:nvme` -> [("/dev/sda", "sat"), ("/dev/nvme0n1", "nvme")]"""
+    devices = []
+    for item in spec.split(","):
+        name, _, kind = item.strip().partition(":")
+        if name:
+            devices.append((name if name.startswith("/") else f"/dev/{name}", kind or "auto"))
+    return devices
+
+
+def parse_smartctl(data: dict) -> dict:
+    """Pick the interesting parts of `smartctl -j` output"""
+    result = {
+        "model": data.get("model_name") or data.get("model_family"),
+        "serial": data.get("serial_number"),
+        "passed": data.get("smart_status", {}).get("passed"),
+        "temperature": data.get("temperature", {}).get("current"),
+        "power_on_hours": data.get("power_on_time", {}).get("hours"),
+        "attributes": [],
+        "counters": {},
+    }
+    for attr in data.get("ata_smart_attributes", {}).get("table", []):
+        raw = attr.get("raw", {})
+        result["attributes"].append({
+            "id": attr.get("id"),
+            "name": attr.get("name"),
+            "value": attr.get("value"),
+            "worst": attr.get("worst"),
+            "thresh": attr.get("thresh"),
+            "raw": raw.get("string", str(raw.get("value", ""))),
+            "failed": attr.get("when_failed") or "",
+        })
+        if attr.get("id") in COUNTERS:
+            result["counters"][COUNTERS[attr["id"]]] = raw.get("value", 0)
+    nvme = data.get("nvme_smart_health_information_log")
+    if nvme:
+        for key, value in nvme.items():
+            if isinstance(value, (int, float)):
+                result["attributes"].append({"id": None, "name": key, "value": None, "worst": None,
+                                             "thresh": None, "raw": str(value), "failed": ""})
+        result["counters"]["media_errors"] = nvme.get("media_errors", 0)
+        result["percentage_used"] = nvme.get("percentage_used")
+        if result["temperature"] is None:
+            result["temperature"] = nvme.get("temperature")
+        if result["power_on_hours"] is None:
+            result["power_on_hours"] = nvme.get("power_on_hours")
+    return result
+
+
+def is_standby(data: dict) -> bool:
+    messages = data.get("smartctl", {}).get("messages", [])
+    return any("STANDBY" in m.get("string", "") or "SLEEP" in m.get("string", "") for m in messages)
+
+
+class SmartSampler:
+    """Polls SMART data for every disk on a schedule and serves it from a cache.
+
+    `smartctl -n standby` skips disks that are spun down, so sampling never
+    wakes a sleeping drive; the last reading is kept and reported as stale.
+    Each reading stores the full attribute table plus a short history of
+    temperature and error counters, persisted so trends survive restarts.
+    """
+
+    def __init__(self, cache_path: str, devices: Optional[List[Tuple[str, str]]] = None,
+                 keep_history: int = 500, timeout: float = 30.0, temp_warn: float = 50.0):
+        self.cache_path = cache_path
+        self.devices = devices
+        self.keep_history = keep_history
+        self.timeout = timeout
+        self.temp_warn = temp_warn
+        self.disks: Dict[str, dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                self.disks = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[smart] Failed to load cache: {e}")
+
+    def _save(self):
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.disks, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"[smart] Failed to save cache: {e}")
+
+    async def _read(self, device: str, kind: str) -> dict:
+        cmd = ["smartctl", "-n", "standby", "-j", "-i", "-H", "-A"]
+        if kind != "auto":
+            cmd += ["-d", kind]
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, device, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise RuntimeError(f"smartctl timed out after {self.timeout:.0f}s")
+        try:
+            return json.loads(out)
+        except ValueError:
+            raise RuntimeError("smartctl produced no JSON (smartmontools 7.0+ is required)")
+
+    async def _poll_one(self, device: str, kind: str):
+        name = os.path.basename(device)
+        disk = self.disks.setdefault(name, {"device": device, "type": kind, "history": []})
+        disk["checked_at"] = time.time()
+        try:
+            data = await self._read(device, kind)
+        except (OSError, RuntimeError) as e:
+            disk["error"] = str(e)
+            return
+        if is_standby(data):
+            disk["standby"] = True
+            disk["error"] = None
+            return
+        parsed = parse_smartctl(data)
+        if parsed["temperature"] is None and not parsed["attributes"]:
+            messages = data.get("smartctl", {}).get("messages", [])
+            disk["error"] = "; ".join(m.get("string", "") for m in messages) or "no SMART data"
+            return
+        disk.update(parsed, standby=False, error=None, sampled_at=disk["checked_at"])
+        disk["history"].append([round(disk["checked_at"]), parsed["temperature"], parsed["counters"]])
+        del disk["history"][:-self.keep_history]
+
+    async def poll(self):
+        devices = self.devices if self.devices is not None else discover_disks()
+        await asyncio.gather(*(self._poll_one(device, kind) for device, kind in devices))
+        await asyncio.to_thread(self._save)
+
+    def errors_grew(self, name: str, within: float = 86400, now: Optional[float] = None) -> bool:
+        """Whether an error counter of a cached disk grew in the last `within` seconds"""
+        now = time.time() if now is None else now
+        history = self.disks.get(name, {}).get("history", [])
+        if len(history) < 2:
+            return False
+        # Compare against the last reading before the window (or the first one we have)
+        before = [h for h in history if h[0] < now - within]
+        baseline = (before[-1] if before else history[0])[2]
+        return any(value > baseline.get(key, value) for key, value in history[-1][2].items())
+
+    def warnings(self, name: str, now: Optional[float] = None) -> List[str]:
+        """Health problems and worrying trends for one cached disk"""
+        now = time.time() if now is None else now
+        disk = self.disks.get(name)
+        if not disk:
+            return []
+        found = []
+        if disk.get("passed") is False:
+            found.append("SMART overall health check FAILED")
+        for attr in disk.get("attributes", []):
+            if attr.get("failed"):
+                found.append(f"{attr['name']} failed ({attr['failed']})")
+        temp = disk.get("temperature")
+        if temp is not None and temp >= self.temp_warn:
+            found.append(f"temperature {temp} °C ≥ {self.temp_warn:g} °C")
+        history = disk.get("history", [])
+        if history:
+            latest = history[-1][2]
+            week = [h for h in history if h[0] >= now - 7 * 86400]
+            for key, value in latest.items():
+                oldest = (week or history)[0][2].get(key)
+                if oldest is not None and value > oldest:
+                    found.append(f"{key} grew {oldest} → {value} in the last {format_age(now - (week or history)[0][0])}")
+                elif value:
+                    found.append(f"{key} = {value}")
+            hour = [h for h in history if h[0] >= now - 3600 and h[1] is not None]
+            if len(hour) >= 2 and hour[-1][1] - hour[0][1] >= 10:
+                found.append(f"temperature rose {hour[0][1]} → {hour[-1][1]} °C within an hour")
+        if disk.get("percentage_used") is not None and disk["percentage_used"] >= 90:
+            found.append(f"NVMe wear {disk['percentage_used']}%")
+        return found
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
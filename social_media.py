@@ -3,6 +3,9 @@ import re
 import yt_dlp
 import instaloader
 import asyncio
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import datetime
 from typing import Optional, Dict, Any
 import aiohttp
@@ -12,9 +15,68 @@ import ssl
 import requests
 from bs4 import BeautifulSoup
 
+# Heights offered in a preview; Telegram bots can't upload files over 50 MB anyway
+PREVIEW_MAX_HEIGHT = 1080
+PREVIEW_QUALITIES = 4
+
+
+def quality_format(height: Optional[int]) -> str:
+    """yt-dlp format selector for a quality picked from a preview"""
+    return f"best[height<={height}]/best" if height else "best"
+
+
+def summarize_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Title, duration and the downloadable qualities with estimated sizes"""
+    duration = info.get('duration') or 0
+    sizes: Dict[int, Optional[float]] = {}
+    # formats are sorted worst to best, so the last one of each height is what best[height<=h] picks
+    for f in info.get('formats') or [info]:
+        height = f.get('height')
+        if not height or height > PREVIEW_MAX_HEIGHT or f.get('vcodec') == 'none' or f.get('acodec') == 'none':
+            continue
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and f.get('tbr') and duration:
+            size = f['tbr'] * 1000 / 8 * duration
+        sizes[height] = size
+    qualities = [{'height': h, 'size': sizes[h]} for h in sorted(sizes, reverse=True)[:PREVIEW_QUALITIES]]
+    if not qualities:
+        qualities = [{'height': None, 'size': info.get('filesize') or info.get('filesize_approx')}]
+    return {
+        'id': info.get('id'),
+        'extractor': info.get('extractor_key') or info.get('extractor') or 'generic',
+        'title': info.get('title') or f"Video {info.get('id', 'Unknown')}",
+        'uploader': info.get('uploader') or info.get('channel'),
+        'duration': duration,
+        'qualities': qualities,
+    }
+
+
+@lru_cache(maxsize=256)
+def video_key(url: str) -> Optional[str]:
+    """`extractor:id` of the video a URL points to, without fetching it.
+
+    youtu.be links, watch URLs and ones with extra parameters (`&t=30`) map
+    to the same key. None when no specific yt-dlp extractor knows the URL.
+    The first call compiles every extractor's URL pattern (about a second on
+    a Pi), so call it from a thread.
+    """
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        return f"{ie.ie_key()}:{video_id}" if video_id else None
+    return None
+
+
 class SocialMediaDownloader:
-    def __init__(self, download_path: str = "downloads"):
+    def __init__(self, download_path: str = "downloads", preview_ttl: float = 1800, max_previews: int = 64):
         self.download_path = download_path
+        self.preview_ttl = preview_ttl
+        self.max_previews = max_previews
+        self._previews: "OrderedDict[str, tuple]" = OrderedDict()
+        self._preview_urls: Dict[str, str] = {}
+        self.preview_hits = 0
+        self.preview_misses = 0
         if not os.path.exists(download_path):
             os.makedirs(download_path)
         
@@ -64,14 +126,75 @@ class SocialMediaDownloader:
             }
         })
 
-    async def download_youtube(self, url: str) -> Optional[Dict[str, Any]]:
+    # ---- metadata previews ----
+
+    def _cached_preview(self, url: str, key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        key = key or self._preview_urls.get(url)
+        entry = self._previews.get(key) if key else None
+        if entry is None:
+            return None
+        expires, summary = entry
+        if expires < time.monotonic():
+            del self._previews[key]
+            return None
+        self._previews.move_to_end(key)
+        return summary
+
+    def _store_preview(self, url: str, summary: Dict[str, Any]):
+        key = f"{summary['extractor']}:{summary['id']}"
+        self._previews[key] = (time.monotonic() + self.preview_ttl, summary)
+        self._previews.move_to_end(key)
+        self._preview_urls[url] = key
+        while len(self._previews) > self.max_previews:
+            self._previews.popitem(last=False)
+        if len(self._preview_urls) > self.max_previews * 4:
+            self._preview_urls = {u: k for u, k in self._preview_urls.items() if k in self._previews}
+
+    def clear_previews(self) -> int:
+        """Drop every cached preview; returns how many there were"""
+        count = len(self._previews)
+        self._previews.clear()
+        self._preview_urls.clear()
+        return count
+
+    @staticmethod
+    def _extract_preview(url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+        with yt_dlp.YoutubeDL({**opts, 'skip_download': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+            if 'entries' in info:
+                info = info['entries'][0]
+            # Only the summary leaves the thread; the full info dict (every format) is dropped here
+            return summarize_info(info)
+
+    async def preview(self, url: str, platform: str) -> Dict[str, Any]:
+        """Video metadata without downloading, cached by extractor and video ID for `preview_ttl` seconds"""
+        if platform == 'tiktok':
+            url = await self._resolve_tiktok(url)
+        key = await asyncio.to_thread(video_key, url)
+        if platform != 'tiktok':
+            url = url.split('&')[0]
+        cached = self._cached_preview(url, key)
+        if cached is not None:
+            self.preview_hits += 1
+            return cached
+        self.preview_misses += 1
+        opts = self.tiktok_opts if platform == 'tiktok' else self.ydl_opts
+        summary = await asyncio.to_thread(self._extract_preview, url, opts)
+        summary['url'] = url
+        self._store_preview(url, summary)
+        return summary
+
+    # ---- downloads ----
+
+    async def download_youtube(self, url: str, fmt: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Download video from YouTube"""
         try:
             print(f"Starting video download from URL: {url}")
             clean_url = url.split('&')[0]
             print(f"Cleaned URL: {clean_url}")
             
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+            opts = {**self.ydl_opts, 'format': fmt} if fmt else self.ydl_opts
+            with yt_dlp.YoutubeDL(opts) as ydl:
                 print("Extracting video information...")
                 info = ydl.extract_info(clean_url, download=True)
                 
@@ -97,17 +220,23 @@ class SocialMediaDownloader:
             print(f"Error downloading from YouTube: {str(e)}")
             return None
 
-    async def download_tiktok(self, url: str) -> Optional[Dict[str, Any]]:
+    async def _resolve_tiktok(self, url: str) -> str:
+        """Expand vt.tiktok.com short links"""
+        if 'vt.tiktok.com' in url:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url, allow_redirects=True) as response:
+                    url = str(response.url)
+                    print(f"Got full URL: {url}")
+        return url
+
+    async def download_tiktok(self, url: str, fmt: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Download video from TikTok using yt-dlp"""
         try:
             print(f"Starting TikTok video download from URL: {url}")
-            if 'vt.tiktok.com' in url:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, allow_redirects=True) as response:
-                        url = str(response.url)
-                        print(f"Got full URL: {url}")
+            url = await self._resolve_tiktok(url)
             
-            with yt_dlp.YoutubeDL(self.tiktok_opts) as ydl:
+            opts = {**self.tiktok_opts, 'format': fmt} if fmt else self.tiktok_opts
+            with yt_dlp.YoutubeDL(opts) as ydl:
                 print("Extracting video information...")
                 info = ydl.extract_info(url, download=True)
                 
@@ -0,0 +1,157 @@
+import asyncio
+import gzip
+import os
+import signal
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional, Sequence, Union
+
+
+class StreamedProcess:
+    """Subprocess whose combined stdout/stderr is consumed as it arrives.
+
+    Only the last `tail_bytes` are kept in memory for display; the full
+    output is spilled into a gzip file so nothing is lost, however chatty the
+    command is.
+
+    Timeouts and `kill()` take down the whole session, including anything the
+    command left running in the background. Output is read until the command
+    exits and its pipe closes, or for at most `drain_grace` seconds after the
+    command exited while a background child still holds the pipe open.
+    """
+
+    def __init__(
+        self,
+        cmd: Union[str, Sequence[str]],
+        shell: bool = True,
+        cwd: Optional[str] = None,
+        tail_bytes: int = 3500,
+        spill_dir: Optional[str] = None,
+        drain_grace: float = 2.0,
+    ):
+        self.cmd = cmd
+        self.shell = shell
+        self.cwd = cwd
+        self.tail_bytes = tail_bytes
+        self.spill_dir = spill_dir
+        self.drain_grace = drain_grace
+        self.spill_path: Optional[str] = None
+        self.total_bytes = 0
+        self.returncode: Optional[int] = None
+        self.timed_out = False
+        self.killed = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._tail = bytearray()
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._spill = None
+        self._version = 0
+
+    async def start(self):
+        fd, self.spill_path = tempfile.mkstemp(prefix="exec-", suffix=".txt.gz", dir=self.spill_dir)
+        self._spill = gzip.open(os.fdopen(fd, "wb"), "wb")
+        kwargs = dict(
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            stdin=asyncio.subprocess.DEVNULL,
+            cwd=self.cwd,
+            start_new_session=True,
+        )
+        if self.shell:
+            self._proc = await asyncio.create_subprocess_shell(self.cmd, **kwargs)
+        else:
+            self._proc = await asyncio.create_subprocess_exec(*self.cmd, **kwargs)
+        self.started_at = time.monotonic()
+        return self
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._proc.pid if self._proc else None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def tail(self) -> str:
+        return self._tail.decode(errors="replace")
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > len(self._tail)
+
+    def kill(self):
+        # The shell may be gone already while children it backgrounded still run in its session
+        if self._proc and self.finished_at is None:
+            self.killed = True
+            try:
+                os.killpg(self._proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def _read(self):
+        while True:
+            chunk = await self._proc.stdout.read(4096)
+            if not chunk:
+                break
+            self._spill.write(chunk)
+            self.total_bytes += len(chunk)
+            self._tail += chunk
+            if len(self._tail) > self.tail_bytes:
+                del self._tail[:len(self._tail) - self.tail_bytes]
+            self._version += 1
+
+    async def run(
+        self,
+        timeout: Optional[float] = None,
+        on_update: Optional[Callable[["StreamedProcess"], Awaitable[None]]] = None,
+        interval: float = 1.5,
+    ) -> int:
+        """Wait for completion, calling `on_update` at most every `interval` seconds while output changes"""
+        reader = asyncio.create_task(self._read())
+        deadline = None if timeout is None else self.started_at + timeout
+        exited_at = None
+        shown = 0
+        try:
+            while not reader.done():
+                now = time.monotonic()
+                wait = interval
+                if deadline is not None and not self.timed_out:
+                    wait = min(wait, max(0.0, deadline - now))
+                if exited_at is not None:
+                    wait = min(wait, max(0.0, exited_at + self.drain_grace - now))
+                await asyncio.wait({reader}, timeout=wait)
+                if reader.done():
+                    break
+                now = time.monotonic()
+                # proc.wait() also waits for the pipe to close, so look at the exit status directly
+                if exited_at is None and self._proc.returncode is not None:
+                    exited_at = now
+                if exited_at is not None and now >= exited_at + self.drain_grace:
+                    # A background child still holds the pipe; don't wait for it
+                    break
+                if deadline is not None and not self.timed_out and now >= deadline:
+                    self.timed_out = True
+                    self.kill()
+                    exited_at = exited_at or now
+                    continue
+                if on_update and self._version != shown:
+                    shown = self._version
+                    await on_update(self)
+            if reader.done():
+                self.returncode = await self._proc.wait()
+            else:
+                self.returncode = self._proc.returncode
+        finally:
+            if not reader.done():
+                if self._proc.returncode is None:
+                    self.kill()
+                reader.cancel()
+            self.finished_at = time.monotonic()
+            self._spill.close()
+        return self.returncode
+
+    def cleanup(self):
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
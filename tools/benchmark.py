@@ -0,0 +1,252 @@
+"""Benchmark and regression suite for the bot.
+
+Drives the Dispatcher with synthetic updates while every external dependency
+is replaced by a local stand-in: a fake Bot API server, a fake SD WebUI, fake
+OpenWeatherMap/currency APIs, fake `ssh` and `smartctl` binaries (tools/bin)
+and a fake yt-dlp extractor backed by a local media server.
+
+Reported per scenario: handler latency (p50/p95/max), time the event loop was
+blocked per pass over the scenario, and peak RSS; plus throughput under
+concurrent commands. Compare only runs made with the same parameters.
+
+    python tools/benchmark.py                      # run and print
+    python tools/benchmark.py --save bench.json    # store a baseline
+    python tools/benchmark.py --compare bench.json # exit 1 on regression
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import resource
+import sys
+import time
+
+from harness import (OWNER_ID, STRANGER_ID, TOOLS_DIR, WORK_DIR, callback_update, configure_env, make_bot,
+                     message_update)
+from fakes import FakeBotAPI, FakeMediaServer, FakeSDWebUI, FakeWeatherAPI, ServiceThread, install_fake_extractor
+
+SCENARIOS = [
+    ("menu", [(OWNER_ID, t) for t in ["/start", "🍓 Pi Commands", "Downloads", "🧾 Logs", "⬅ Back"]]),
+    ("status", [(OWNER_ID, "/status")]),
+    ("unauthorized", [(STRANGER_ID + i, f"/status spam {i}") for i in range(20)]),
+    ("show_logs", [(OWNER_ID, "/show_logs")]),
+    ("webui", [(OWNER_ID, t) for t in ["/webui_status", "/webui_log 50", "/webui_gen a red fox"]]),
+    ("pc", [(OWNER_ID, t) for t in ["/lock_pc", "/shutdown_pc"]]),
+    ("exec", [(OWNER_ID, "/exec echo benchmark")]),
+    ("youtube", [(OWNER_ID, "/yt https://bench.invalid/watch/clip1 best")]),
+    ("tiktok", [(OWNER_ID, "/tt https://bench.invalid/watch/clip2 best")]),
+    ("preview", [(OWNER_ID, "/yt https://bench.invalid/watch/clip3")]),
+    # "dl:" steps press a button of the latest offer: pick a quality, cancel, then press the spent offer again
+    ("picker", [(OWNER_ID, t) for t in ["/yt https://bench.invalid/watch/clip4", "dl:{token}:720",
+                                         "/yt https://bench.invalid/watch/clip4", "dl:{token}:cancel",
+                                         "dl:{token}:720"]]),
+    ("perf", [(OWNER_ID, "/perf")]),
+    ("disk", [(OWNER_ID, t) for t in ["/disk_health refresh", "/disk_temp", "/disk_health sda"]]),
+]
+THROUGHPUT_MIX = [(OWNER_ID, "/status"), (OWNER_ID, "/show_logs"), (OWNER_ID, "/perf"), (STRANGER_ID, "/start")]
+HIGHER_IS_WORSE = ("p95_ms", "blocked_ms", "peak_rss_mb")
+# Wake-ups later than this count as the loop being blocked; smaller lag is scheduling noise.
+BLOCKED_LAG_S = 0.005
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def blocked_ms(lags) -> float:
+    return sum(lag for lag in lags if lag >= BLOCKED_LAG_S) * 1000
+
+
+def summarize_ms(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class Bench:
+    def __init__(self, main, bot, monitor):
+        self.main = main
+        self.bot = bot
+        self.monitor = monitor
+        self.update_id = 0
+        self.offer_token = None
+
+    async def feed(self, user_id, text) -> float:
+        self.update_id += 1
+        if text.startswith("dl:"):
+            data = text.format(token=self.offer_token)
+            update = callback_update(data, message_id=self.update_id, update_id=self.update_id, user_id=user_id)
+        else:
+            update = message_update(text, update_id=self.update_id, user_id=user_id)
+        offered = set(self.main.download_choices)
+        started = time.perf_counter()
+        await self.main.dp.feed_raw_update(self.bot, update)
+        elapsed = time.perf_counter() - started
+        for token in set(self.main.download_choices) - offered:
+            self.offer_token = token
+        return elapsed
+
+    async def scenario(self, name, updates, iterations):
+        self.monitor.lags.clear()
+        await asyncio.sleep(0.05)
+        samples = []
+        for _ in range(iterations):
+            for user_id, text in updates:
+                samples.append(await self.feed(user_id, text))
+        await asyncio.sleep(self.monitor.interval * 2)
+        return self._result(samples, iterations)
+
+    async def morning_info(self, iterations):
+        self.monitor.lags.clear()
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await self.main.send_morning_info(self.bot)
+            samples.append(time.perf_counter() - started)
+        await asyncio.sleep(self.monitor.interval * 2)
+        return self._result(samples, iterations)
+
+    async def throughput(self, total, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            user_id, text = THROUGHPUT_MIX[i % len(THROUGHPUT_MIX)]
+            async with semaphore:
+                await self.feed(user_id + (i if user_id != OWNER_ID else 0), text)
+
+        self.monitor.lags.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        return {
+            "updates": total,
+            "concurrency": concurrency,
+            "seconds": round(elapsed, 3),
+            "updates_per_s": round(total / elapsed, 1),
+            "blocked_ms": round(blocked_ms(self.monitor.lags), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+    def _result(self, samples, iterations):
+        result = summarize_ms(samples)
+        lags = list(self.monitor.lags)
+        result["blocked_ms"] = round(blocked_ms(lags) / iterations, 1)
+        result["max_lag_ms"] = round(max(lags, default=0.0) * 1000, 1)
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        return result
+
+
+def print_report(report):
+    print(f"{'scenario':<14}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'blocked ms':>12}{'max lag':>10}{'RSS MB':>9}")
+    for name, r in report["scenarios"].items():
+        print(f"{name:<14}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['max_ms']:>10}"
+              f"{r['blocked_ms']:>12}{r['max_lag_ms']:>10}{r['peak_rss_mb']:>9}")
+    t = report["throughput"]
+    print(f"\nthroughput: {t['updates']} updates at concurrency {t['concurrency']} in {t['seconds']} s "
+          f"= {t['updates_per_s']} updates/s, loop blocked {t['blocked_ms']} ms, peak RSS {t['peak_rss_mb']} MB")
+
+
+def compare(report, baseline, tolerance, floor_ms):
+    failures = []
+    if baseline.get("params") != report["params"]:
+        print(f"⚠️ Baseline was recorded with {baseline.get('params')}, this run used {report['params']}")
+    for name, base in baseline.get("scenarios", {}).items():
+        current = report["scenarios"].get(name)
+        if current is None:
+            continue
+        for key in HIGHER_IS_WORSE:
+            floor = floor_ms if key.endswith("_ms") else 0
+            limit = base[key] * (1 + tolerance) + floor
+            if current[key] > limit:
+                failures.append(f"{name}.{key}: {current[key]} > {round(limit, 1)} (baseline {base[key]})")
+    base_tp = baseline.get("throughput", {}).get("updates_per_s")
+    if base_tp and report["throughput"]["updates_per_s"] < base_tp * (1 - tolerance):
+        failures.append(f"throughput: {report['throughput']['updates_per_s']} < {base_tp} updates/s (-{tolerance:.0%})")
+    return failures
+
+
+async def run_suite(args, main, services):
+    perf = importlib.import_module("perf")
+    monitor = perf.LoopLagMonitor(interval=0.005, threshold=0.1)
+    monitor_task = asyncio.create_task(monitor.run())
+    api = await FakeBotAPI().start()
+    bot = make_bot(api)
+    bench = Bench(main, bot, monitor)
+    selected = [s for s in SCENARIOS if not args.only or s[0] in args.only]
+    report = {
+        "params": {"iterations": args.iterations, "updates": args.updates,
+                   "concurrency": args.concurrency, "sd_delay": args.sd_delay},
+        "scenarios": {},
+        "throughput": {},
+    }
+    try:
+        for name, updates in selected:
+            report["scenarios"][name] = await bench.scenario(name, updates, args.iterations)
+        if not args.only or "morning_info" in args.only:
+            report["scenarios"]["morning_info"] = await bench.morning_info(args.iterations)
+        report["throughput"] = await bench.throughput(args.updates, args.concurrency)
+    finally:
+        monitor_task.cancel()
+        await bot.session.close()
+        await api.stop()
+    report["bot_api_calls"] = len(api.calls)
+    report["sd_requests"] = services.servers[0].requests
+    return report
+
+
+def main_cli(args):
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    save_path = os.path.abspath(args.save) if args.save else None
+
+    sd, weather, media = FakeSDWebUI(delay=args.sd_delay), FakeWeatherAPI(), FakeMediaServer()
+    configure_env(
+        SD_API_BASE=sd.url,
+        OPENWEATHER_BASE=weather.url,
+        CURRENCY_API_BASE=weather.url,
+        OPENWEATHER_KEY="bench",
+        CITY_ID="1",
+        PC_IP="127.0.0.1",
+        SMART_DEVICES="sda:sat,sdb:sat",
+    )
+    os.environ["PATH"] = os.path.join(TOOLS_DIR, "bin") + os.pathsep + os.environ.get("PATH", "")
+    os.chdir(WORK_DIR)
+    install_fake_extractor(media.url)
+
+    with ServiceThread(sd, weather, media) as services:
+        main = importlib.import_module("main")
+        report = asyncio.run(run_suite(args, main, services))
+
+    print_report(report)
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {save_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            failures = compare(report, json.load(f), args.tolerance, args.floor_ms)
+        if failures:
+            print("\n❌ Regressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5, help="repetitions per scenario")
+    parser.add_argument("--updates", type=int, default=200, help="updates in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sd-delay", type=float, default=0.2, help="fake SD render time in seconds")
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--save", help="write the report as a baseline JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--floor-ms", type=float, default=10.0, help="absolute slack added to latency limits")
+    sys.exit(main_cli(parser.parse_args()))
@@ -0,0 +1,227 @@
+"""Local stand-ins for the external services the bot talks to."""
+import asyncio
+import socket
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeServer:
+    """Run an aiohttp application on a free localhost port"""
+
+    def __init__(self):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class ServiceThread:
+    """Run fake servers on their own event loop in a daemon thread.
+
+    The bot still makes blocking HTTP calls (requests, yt-dlp) from its event
+    loop, so stand-ins for those services must not share that loop.
+    """
+
+    def __init__(self, *servers: FakeServer):
+        self.servers = servers
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fake-services", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.start(), self.loop).result(timeout=10)
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+
+
+class FakeBotAPI(FakeServer):
+    """Minimal Telegram Bot API: serves queued updates and records every reply"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.replies: asyncio.Queue = asyncio.Queue()
+        self.calls: List[Tuple[float, str, dict]] = []
+        self._message_id = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _message(self, data: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(data.get("chat_id") or 0)
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": str(data.get("text", "")),
+        }
+
+    async def _get_updates(self, data: dict) -> list:
+        timeout = float(data.get("timeout") or 0)
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01))
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        data = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(data)})
+
+        now = time.perf_counter()
+        self.calls.append((now, method, data))
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif method == "sendmediagroup":
+            result = [self._message(data)]
+        elif method.startswith("send") or method.startswith("edit"):
+            result = self._message(data)
+            self.replies.put_nowait((now, method, data))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+# 1x1 transparent PNG
+TINY_PNG_B64 = (
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeSDWebUI(FakeServer):
+    """Stable Diffusion WebUI txt2img endpoint with a configurable render delay"""
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.delay = delay
+        self.requests = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/sdapi/v1/txt2img", self.txt2img)
+        return app
+
+    async def txt2img(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return web.json_response({"images": [TINY_PNG_B64], "parameters": payload, "info": "{}"})
+
+
+class FakeWeatherAPI(FakeServer):
+    """OpenWeatherMap current/forecast and open.er-api currency rates on one port"""
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self.weather)
+        app.router.add_get("/data/2.5/forecast", self.forecast)
+        app.router.add_get("/v6/latest/{base}", self.rates)
+        return app
+
+    async def weather(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "dt": int(time.time()),
+            "clouds": {"all": 40},
+            "main": {"temp": 17.4},
+            "weather": [{"description": "scattered clouds"}],
+        })
+
+    async def forecast(self, request: web.Request) -> web.Response:
+        now = int(time.time())
+        entries = [
+            {
+                "dt": now + hours * 3600,
+                "main": {"temp": 15 + hours},
+                "weather": [{"description": "light rain" if hours % 2 else "few clouds"}],
+            }
+            for hours in range(0, 25, 3)
+        ]
+        return web.json_response({"list": entries})
+
+    async def rates(self, request: web.Request) -> web.Response:
+        return web.json_response({"result": "success", "rates": {"CZK": 24.35, "RUB": 98.1, "EUR": 1.0}})
+
+
+class FakeMediaServer(FakeServer):
+    """Serves a fixed-size video payload for the fake yt-dlp extractor"""
+
+    def __init__(self, size: int = 2 * 1024 * 1024):
+        super().__init__()
+        self.payload = b"\0" * size
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/media/{name}", self.media)
+        return app
+
+    async def media(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.payload, content_type="video/mp4")
+
+
+def install_fake_extractor(media_url: str):
+    """Register an extractor for https://bench.invalid/watch/<id> on every YoutubeDL instance.
+
+    The extractor returns a direct media URL on the local media server, so the
+    real yt-dlp download path runs without touching the internet.
+    """
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class BenchIE(InfoExtractor):
+        IE_NAME = "bench"
+        _VALID_URL = r"https?://bench\.invalid/watch/(?P<id>\w+)"
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {
+                "id": video_id,
+                "title": f"Bench video {video_id}",
+                "duration": 42,
+                "ext": "mp4",
+                "url": f"{media_url}/media/{video_id}.mp4",
+                "height": 720,
+            }
+
+    original = yt_dlp.YoutubeDL.add_default_info_extractors
+
+    def add_default_info_extractors(self):
+        self.add_info_extractor(BenchIE())
+        original(self)
+
+    yt_dlp.YoutubeDL.add_default_info_extractors = add_default_info_extractors
+    return BenchIE
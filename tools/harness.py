@@ -0,0 +1,79 @@
+"""Shared setup for the local tools: environment defaults and a bot wired to fakes.
+
+Import this before `main` so the required environment variables exist.
+"""
+import os
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+for entry in (ROOT, TOOLS_DIR):
+    if entry not in sys.path:
+        sys.path.insert(0, entry)
+
+OWNER_ID = 424242
+STRANGER_ID = 31337
+WORK_DIR = tempfile.mkdtemp(prefix="statusbot-")
+
+
+def configure_env(**overrides):
+    defaults = {
+        "BOT_TOKEN": "123456:LOCAL-HARNESS",
+        "MY_ID": str(OWNER_ID),
+        "PC_MAC": "00:00:00:00:00:00",
+        "PC_IP": "127.0.0.1",
+        "SECRET_KEY": "harness",
+        "LOG_FILE_PATH": os.path.join(WORK_DIR, "logs", "access.log"),
+        "SSH_KEY_PATH": os.path.join(WORK_DIR, "id_rsa"),
+        "SSH_USER": "harness",
+        "WEBUI_BASE": "/opt/webui",
+        "UPDATE_SCRIPT_PATH": "/bin/true",
+        "WAKE_TRIGGER_BASE": "http://127.0.0.1:9/wake",
+    }
+    defaults.update(overrides)
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def make_bot(api):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.url))
+    return Bot(token=os.environ["BOT_TOKEN"], session=session)
+
+
+def message_update(text, update_id=1, user_id=OWNER_ID):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def callback_update(data, message_id, update_id=1, user_id=OWNER_ID):
+    """A press on an inline button of the bot's message `message_id`"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "harness",
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"},
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+                "text": "preview",
+            },
+        },
+    }
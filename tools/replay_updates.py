@@ -0,0 +1,137 @@
+"""Replay recorded updates through the dispatcher and measure handler latency.
+
+Latency is measured end to end: from the moment an update is handed to the
+bot (long-poll response or webhook POST) until the first reply reaches the
+fake Bot API.
+
+    python tools/replay_updates.py --mode both --updates updates.jsonl
+
+Record updates from the live bot by setting RECORD_UPDATES_PATH.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from harness import configure_env, make_bot, message_update
+
+configure_env()
+
+from aiohttp import ClientSession  # noqa: E402
+
+from fakes import FakeBotAPI, FakeServer  # noqa: E402
+import main  # noqa: E402
+from webhook import build_webhook_app  # noqa: E402
+
+WEBHOOK_PATH = "/replay/webhook"
+WEBHOOK_SECRET = "replay-secret"
+DEFAULT_TEXTS = ["/start", "🍓 Pi Commands", "/status", "/show_logs", "⬅ Back"]
+
+
+def synthetic_updates(texts):
+    return [message_update(text, update_id=i, user_id=main.MY_ID) for i, text in enumerate(texts, start=1)]
+
+
+def load_updates(file_path):
+    with open(file_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class WebhookServer(FakeServer):
+    def __init__(self, app):
+        super().__init__()
+        self._app = app
+
+    def build_app(self):
+        return self._app
+
+
+async def _await_reply(api: FakeBotAPI, started: float, timeout: float):
+    try:
+        replied_at, _, _ = await asyncio.wait_for(api.replies.get(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+    return (replied_at - started) * 1000
+
+
+def _drain(api: FakeBotAPI):
+    while not api.replies.empty():
+        api.replies.get_nowait()
+
+
+async def replay_polling(updates, timeout):
+    api = await FakeBotAPI().start()
+    bot = make_bot(api)
+    polling = asyncio.create_task(main.dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    latencies = []
+    try:
+        for i, update in enumerate(updates, start=1):
+            await asyncio.sleep(0.05)
+            _drain(api)
+            update = dict(update, update_id=i)
+            started = time.perf_counter()
+            api.updates.put_nowait(update)
+            latencies.append(await _await_reply(api, started, timeout))
+    finally:
+        await main.dp.stop_polling()
+        await polling
+        await bot.session.close()
+        await api.stop()
+    return latencies
+
+
+async def replay_webhook(updates, timeout):
+    api = await FakeBotAPI().start()
+    bot = make_bot(api)
+    server = await WebhookServer(build_webhook_app(main.dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET)).start()
+    latencies = []
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+    try:
+        async with ClientSession() as client:
+            async with client.post(server.url + WEBHOOK_PATH, json={}, headers={}) as resp:
+                if resp.status != 401:
+                    print(f"⚠️ Webhook accepted a request without secret (HTTP {resp.status})")
+            for i, update in enumerate(updates, start=1):
+                _drain(api)
+                started = time.perf_counter()
+                async with client.post(server.url + WEBHOOK_PATH, json=dict(update, update_id=i), headers=headers) as resp:
+                    resp.raise_for_status()
+                latencies.append(await _await_reply(api, started, timeout))
+                await asyncio.sleep(0.05)
+    finally:
+        await server.stop()
+        await api.stop()
+    return latencies
+
+
+def report(mode, updates, latencies):
+    print(f"\n== {mode} ==")
+    for update, latency in zip(updates, latencies):
+        text = update.get("message", {}).get("text", "<non-message update>")
+        shown = "no reply" if latency is None else f"{latency:8.1f} ms"
+        print(f"{shown:>12}  {text[:50]}")
+    measured = [l for l in latencies if l is not None]
+    if measured:
+        measured.sort()
+        p95 = measured[min(len(measured) - 1, int(len(measured) * 0.95))]
+        print(f"min {measured[0]:.1f} ms | p50 {statistics.median(measured):.1f} ms | "
+              f"p95 {p95:.1f} ms | max {measured[-1]:.1f} ms | replies {len(measured)}/{len(latencies)}")
+
+
+async def run(args):
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(DEFAULT_TEXTS)
+    updates = updates * args.repeat
+    modes = ["polling", "webhook"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        replay = replay_polling if mode == "polling" else replay_webhook
+        report(mode, updates, await replay(updates, args.timeout))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    parser.add_argument("--updates", help="JSON-lines file with recorded updates")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for a reply")
+    asyncio.run(run(parser.parse_args()))
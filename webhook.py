@@ -0,0 +1,63 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+SECRET_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Append every incoming update to a JSON-lines file for later replay"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            with open(self.path, "a") as f:
+                f.write(event.model_dump_json(exclude_none=True) + "\n")
+        except Exception as e:
+            print(f"[recorder] Error: {e}")
+        return await handler(event, data)
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret: str) -> web.Application:
+    """Create the aiohttp application that feeds webhook updates into the dispatcher"""
+    if not SECRET_TOKEN_RE.match(secret):
+        raise RuntimeError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ or -")
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str, path: str, host: str, port: int, secret: str):
+    """Serve updates from an embedded aiohttp server until cancelled"""
+    app = build_webhook_app(dp, bot, path, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    webhook_url = f"{url.rstrip('/')}{path}"
+    await bot.set_webhook(
+        webhook_url,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"[webhook] Listening on {host}:{port}{path}, public URL {webhook_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        try:
+            await bot.delete_webhook()
+        except Exception as e:
+            print(f"[webhook] Failed to remove webhook: {e}")
+        await runner.cleanup()